@@ -13,6 +13,18 @@ Classes:
     DeferrableLoad: models deferrable loads, such as electric vehicles
     ShiftableLoad: models uninterruptible loads, e.g. dishwashers
     CurtailableLoad: models curtailable loads, e.g. solar PV
+    Household: set of devices behind the same meter
+    CooBlock: variables and constraints of a device, in COO format
+
+Functions:
+    add_sparse: add linear constraints to a CPLEX model, from a sparse matrix
+    assemble_household: add all devices of a household to a CPLEX model
+    assemble_lp_sparse: build a model of unlinked devices from a sparse matrix
+    household_model: build the standalone model of a household
+    pack_key: pack the identity of a variable into a 64-bit integer key
+    key_index: map the packed keys of variables to their index in a model
+    name_of: name of a variable, given its packed key
+    generate_devices: generate a random set of devices for each household
 
 You can add device models by adding the corresponding class, or simply changing
     numerical parameters of existing classes.
@@ -21,12 +33,427 @@ Contact info: mathieu.tanneau@polymtl.ca
 """
 
 
+import array
+import contextlib
+import gc
+import os
+
 import numpy as np
+import scipy.sparse as sp
 import cplex
 
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    # numba is optional: without it, kernels run as plain Python functions
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+
+# fill functions generated at runtime, by (class name, T)
+_fill_cache = {}
+
+
+def _put_rows(coo, k, row, ind, val):
+    """
+    Write constraint rows into preallocated COO arrays.
+
+    All rows have the same number of coefficients.
+
+    Args:
+        coo: tuple of (rows, cols, vals) arrays
+        k: position at which the coefficients are written
+        row: index of each row, int array of shape (n,)
+        ind: column indices of the coefficients, int array of shape (n, p)
+        val: values of the coefficients, broadcastable to shape (n, p)
+
+    Returns:
+        the position that follows the last written coefficient
+    """
+    rows, cols, vals = coo
+    ind = np.asarray(ind)
+    n = ind.size
+    rows[k:k+n] = np.repeat(row, ind.shape[1])
+    cols[k:k+n] = ind.ravel()
+    vals[k:k+n] = np.broadcast_to(val, ind.shape).ravel()
+    return k + n
+
+
+class CooBlock:
+    """
+    Variables and constraints of a device, in coordinate (COO) format.
+
+    Column indices refer to the block's own variables, and row indices to the
+        block's own constraints; both start at zero.
+    Link entries are the coefficients of the block's variables in the
+        household's net load linking constraints.
+    """
+
+    def __init__(
+        self,
+        var_names=[],
+        lb=[],
+        ub=[],
+        types='',
+        ctr_names=[],
+        senses='',
+        rhs=[],
+        rows=[],
+        cols=[],
+        vals=[],
+        link_t=[],
+        link_cols=[],
+        link_vals=[],
+        link_rhs=None,
+        var_groups={},
+        children=[]
+    ):
+        """
+        Class constructor.
+
+        Parameters
+        ----------
+        var_names : list of string
+            names of the variables
+        lb : float array
+            lower bounds of the variables
+        ub : float array
+            upper bounds of the variables
+        types : string
+            type of each variable: 'C' (continuous) or 'B' (binary)
+        ctr_names : list of string
+            names of the constraints
+        senses : string
+            sense of each constraint: 'E', 'L' or 'G'
+        rhs : float array
+            right-hand side of the constraints
+        rows : int array
+            row index of each non-zero coefficient
+        cols : int array
+            column index of each non-zero coefficient
+        vals : float array
+            value of each non-zero coefficient
+        link_t : int array
+            time index of each linking coefficient
+        link_cols : int array
+            column index of each linking coefficient
+        link_vals : float array
+            value of each linking coefficient
+        link_rhs : float array, or None
+            term added to the right-hand side of the linking constraints
+        var_groups : dictionnary
+            maps the name of each group of variables (e.g. 'soc') to the
+            column indices of that group
+        children : list of (Device, CooBlock, int)
+            devices whose blocks were stacked into this one, together with
+            their block and the column offset of that block
+        """
+        self.var_names = var_names
+        self.lb = np.asarray(lb, dtype=np.float64)
+        self.ub = np.asarray(ub, dtype=np.float64)
+        self.types = types
+        self.ctr_names = ctr_names
+        self.senses = senses
+        self.rhs = np.asarray(rhs, dtype=np.float64)
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.cols = np.asarray(cols, dtype=np.int64)
+        self.vals = np.asarray(vals, dtype=np.float64)
+        self.link_t = np.asarray(link_t, dtype=np.int64)
+        self.link_cols = np.asarray(link_cols, dtype=np.int64)
+        self.link_vals = np.asarray(link_vals, dtype=np.float64)
+        self.link_rhs = link_rhs
+        self.var_groups = dict(var_groups)
+        self.children = list(children)
+
+        return
+
+
+def _stack_blocks(blocks, devices=[]):
+    """
+    Concatenate several COO blocks into one.
+
+    Column and row indices of each block are shifted by the number of
+        variables and constraints of the blocks that precede it.
+    If given, `devices` are the owners of `blocks`, and are recorded as
+        children of the stacked block.
+    """
+    if len(blocks) == 0:
+        return CooBlock()
+
+    var_offset = np.cumsum([0] + [len(b.var_names) for b in blocks])
+    ctr_offset = np.cumsum([0] + [len(b.ctr_names) for b in blocks])
+    # right-hand side terms are accumulated in a single buffer
+    link_rhs = None
+    for b in blocks:
+        if b.link_rhs is None:
+            continue
+        if link_rhs is None:
+            link_rhs = np.array(b.link_rhs, dtype=np.float64)
+        else:
+            link_rhs += b.link_rhs
+
+    return CooBlock(
+        var_names=[name for b in blocks for name in b.var_names],
+        lb=np.concatenate([b.lb for b in blocks]),
+        ub=np.concatenate([b.ub for b in blocks]),
+        types=''.join([b.types for b in blocks]),
+        ctr_names=[name for b in blocks for name in b.ctr_names],
+        senses=''.join([b.senses for b in blocks]),
+        rhs=np.concatenate([b.rhs for b in blocks]),
+        rows=np.concatenate(
+            [b.rows + ctr_offset[i] for i, b in enumerate(blocks)]
+        ),
+        cols=np.concatenate(
+            [b.cols + var_offset[i] for i, b in enumerate(blocks)]
+        ),
+        vals=np.concatenate([b.vals for b in blocks]),
+        link_t=np.concatenate([b.link_t for b in blocks]),
+        link_cols=np.concatenate(
+            [b.link_cols + var_offset[i] for i, b in enumerate(blocks)]
+        ),
+        link_vals=np.concatenate([b.link_vals for b in blocks]),
+        link_rhs=link_rhs,
+        children=zip(devices, blocks, var_offset.tolist())
+    )
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    """
+    Pause the garbage collector, then restore its previous state.
+
+    Building one pair per row allocates many small containers, which cannot
+        form reference cycles: collecting them is wasted work. If the
+        collector is already disabled, e.g. by the caller, its state is not
+        touched.
+    """
+    if not gc.isenabled():
+        yield
+        return
+    gc.disable()
+    try:
+        yield
+    finally:
+        gc.enable()
+
+
+def _sparse_pairs(A, shift=0):
+    """
+    Split a sparse matrix into one (indices, values) pair per row (CSR format)
+        or per column (CSC format).
+
+    Pairs are given as `[ind, val]` lists, which CPLEX accepts in place of
+        `cplex.SparsePair` objects, without their per-object overhead.
+        Indices and values are typed `array.array` slices (C int and double),
+        which CPLEX reads without unboxing each element.
+
+    Args:
+        A: scipy.sparse matrix, in CSR or CSC format
+        shift: offset added to all indices
+
+    The garbage collector is paused while pairs are built, see `_gc_paused`.
+
+    Returns:
+        a list of `[ind, val]` pairs
+    """
+    ptr = A.indptr.tolist()
+    ind = array.array('i')
+    ind.frombytes((A.indices + shift).astype(np.intc).tobytes())
+    val = array.array('d')
+    val.frombytes(A.data.astype(np.float64).tobytes())
+
+    # the list is allocated once, at its final size
+    with _gc_paused():
+        pairs = [None] * (len(ptr) - 1)
+        for i in range(len(pairs)):
+            pairs[i] = [ind[ptr[i]:ptr[i+1]], val[ptr[i]:ptr[i+1]]]
+
+    return pairs
+
+
+def add_sparse(m, names, senses, rhs, A, shift=0):
+    """
+    Add linear constraints to a CPLEX model, from a sparse matrix.
+
+    Args:
+        m: existing CPLEX instance
+        names: name of each constraint
+        senses: sense of each constraint, as a string
+        rhs: right-hand side of each constraint
+        A: scipy.sparse constraint matrix, in any format
+        shift: offset added to all column indices, e.g., the index in `m` of
+            the first variable of A
+
+    Returns:
+        c_idx: range of the new constraints' indices in `m`
+    """
+    return m.linear_constraints.add(
+        names=names,
+        senses=senses,
+        rhs=np.asarray(rhs, dtype=np.float64).tolist(),
+        lin_expr=_sparse_pairs(sp.csr_matrix(A), shift=shift)
+    )
+
+
+def _block_matrix(blk, v_base=0, n_var=None):
+    """
+    Build the constraint matrix of a COO block, in scipy.sparse format.
+
+    Constraints are written as row bounds, i.e., lb <= A x <= ub, as in
+        `scipy.optimize.LinearConstraint`.
+
+    Args:
+        blk: a CooBlock
+        v_base: column of the block's first variable in the matrix
+        n_var: number of columns of the matrix; defaults to `v_base` plus the
+            number of variables of the block
+
+    Returns:
+        A: constraint matrix, in CSR format
+        lb: lower bound of each row (-inf for 'L' constraints)
+        ub: upper bound of each row (+inf for 'G' constraints)
+        senses: sense of each constraint
+    """
+    n_ctr = len(blk.ctr_names)
+    if n_var is None:
+        n_var = v_base + len(blk.var_names)
+
+    A = sp.coo_matrix(
+        (blk.vals, (blk.rows, v_base + blk.cols)),
+        shape=(n_ctr, n_var)
+    ).tocsr()
+    senses = np.array(list(blk.senses), dtype='U1')
+    lb = np.where(senses == 'L', -np.inf, blk.rhs)
+    ub = np.where(senses == 'G', np.inf, blk.rhs)
+
+    return A, lb, ub, blk.senses
+
+
+def _netload_rows(ctr2idx, time_window, r_label='', link_name='link_netLoad'):
+    """
+    Look up, by name, the linking constraints that devices are added to.
+
+    Callers that add several devices of a household should look them up once
+        and pass them as `link_rows`.
+
+    Args:
+        ctr2idx: constraint name-to-index dictionnary
+        time_window: a list of the time indices [0, ..., T-1]
+        r_label: label of the household, as used in device names
+        link_name: name of the linking constraints, without time index, see
+            `Device.link_name`
+
+    Returns:
+        link_rows: index of the linking constraint, for each time index
+
+    Raises:
+        ValueError: if `ctr2idx` is None, i.e., linking constraints can only
+            be given as `link_rows`
+    """
+    if ctr2idx is None:
+        raise ValueError(
+            'linking constraints cannot be looked up without ctr2idx: '
+            'pass link_rows'
+        )
+    return [ctr2idx[f'{r_label}{link_name}_{t}'] for t in time_window]
+
+
+def _load_block(m, blk, var2idx, ctr2idx, link_rows):
+    """
+    Add a COO block to a CPLEX model.
+
+    All variables, together with their coefficients in the linking
+        constraints, are added in a single call. Same for the constraints.
+    Coefficients are handed to CPLEX column-wise (linking constraints) and
+        row-wise (block constraints), through scipy.sparse CSC/CSR matrices.
+
+    Args:
+        m: existing CPLEX instance
+        blk: the CooBlock to be added
+        var2idx: variable name-to-index dictionnary, updated in-place; if
+            None, names are not recorded
+        ctr2idx: constraint name-to-index dictionnary, same as var2idx
+        link_rows: index of the net load linking constraint, for each time
+            index. If empty, the block is not linked, and its linking
+            coefficients are ignored.
+
+    Returns:
+        v_base: index of the block's first variable in `m`
+            `m`, `var2idx` and `ctr2idx` are modified in-place
+    """
+    n_var = len(blk.var_names)
+    n_ctr = len(blk.ctr_names)
+    # linking rows are converted once, and shared by all the block's columns
+    link_rows = np.asarray(link_rows, dtype=np.int64)
+    linked = link_rows.size > 0
+
+    # I.
+    # Add variables
+    v_base = m.variables.get_num()
+    if n_var > 0:
+        # coefficients in the linking constraints, column-wise
+        columns = None
+        if linked:
+            link = sp.csc_matrix(
+                (blk.link_vals, (link_rows[blk.link_t], blk.link_cols)),
+                shape=(m.linear_constraints.get_num(), n_var)
+            )
+            columns = _sparse_pairs(link)
+
+        v_idx = m.variables.add(
+            names=blk.var_names,
+            lb=blk.lb.tolist(),
+            ub=blk.ub.tolist(),
+            # only specify types when there are binary variables, otherwise
+            # the problem would be turned into a MIP
+            types=blk.types if 'B' in blk.types else '',
+            columns=columns
+        )
+        if var2idx is not None:
+            var2idx.update(zip(blk.var_names, v_idx))
+        v_base = v_idx[0]
+
+    # II.
+    # Add constraints
+    if n_ctr > 0:
+        A = sp.coo_matrix(
+            (blk.vals, (blk.rows, blk.cols)),
+            shape=(n_ctr, n_var)
+        )
+        c_idx = add_sparse(
+            m, blk.ctr_names, blk.senses, blk.rhs, A, shift=v_base
+        )
+        if ctr2idx is not None:
+            ctr2idx.update(zip(blk.ctr_names, c_idx))
+
+    # III.
+    # Update right-hand side of linking constraints
+    if blk.link_rhs is not None and linked:
+        link_rows = link_rows.tolist()
+        rhs = np.asarray(m.linear_constraints.get_rhs(link_rows))
+        rhs = rhs + blk.link_rhs
+        m.linear_constraints.set_rhs(list(zip(link_rows, rhs.tolist())))
+
+    return v_base
+
 
 class Device:
-    """Energy device."""
+    """
+    Energy device.
+
+    Once the device is added to a model, `var_idx` maps the name of each
+        group of variables to their index in the model, e.g. the state of
+        charge of a battery at time t is variable `var_idx['soc'][t]`.
+    """
+
+    # name of the linking constraints that the device is added to, i.e.,
+    # constraint <link_name>_t gathers the loads of all devices at time t
+    link_name = 'link_netLoad'
 
     def __init__(
         self,
@@ -34,29 +461,32 @@ class Device:
     ):
         """Class constructor."""
         self.label = label
+        self.var_idx = {}
         return
 
     def update_model(
         self,
         m,
-        var2idx={},
-        ctr2idx={},
+        var2idx=None,
+        ctr2idx=None,
         time_window=[],
         delta_t=1,
         r_label='',
-        binaries=True
+        binaries=True,
+        link_rows=None
     ):
         """
         Add self to household model.
 
-        This function must be implemented in all child classes.
+        The device's variables and constraints are built by `to_coo`, then
+            added to `m` with one call for variables and one for constraints.
 
         Args:
             m: existing CPLEX instance, to which that device's model is added
             var2idx: a dictionnary that maps the name of the variables in `m`
-                to their index number. Indexing by number speeds-up the
-                building of the model.
-                This dictionnary must be updated accordingly.
+                to their index number, updated accordingly. If None, names are
+                not recorded: variables are then located through the returned
+                indices, or `var_idx`.
             ctr2idx: a dictionnary that maps the name of the constraints in `m`
                 to their index number. Same as var2idx.
             time_window: a list of the time indices [0, ..., T-1]
@@ -67,15 +497,245 @@ class Device:
             binaries: boolean that indicates whether binary requirements are to
                 be enforced or not. Setting this parameter to `False` will
                 relax binary requirements for that device's model.
+            link_rows: index of the household's net load linking constraints,
+                for each time step, e.g. the range returned by CPLEX when
+                they were created. If not given, they are looked up by name
+                in `ctr2idx`, see `link_name`.
 
             Returns:
-                nothing, but `m`, `var2idx` and `ctr2idx` are modified in-place
+                v_idx: range of the indices of self's variables in `m`
+                    `m`, `var2idx` and `ctr2idx` are modified in-place
 
             Raises:
+                ValueError: if neither `link_rows` nor `ctr2idx` is given
+        """
+        blk = self.to_coo(
+            time_window=time_window,
+            delta_t=delta_t,
+            r_label=r_label,
+            binaries=binaries
+        )
+        if link_rows is None:
+            link_rows = _netload_rows(
+                ctr2idx, time_window, r_label, self.link_name
+            )
+        v_base = _load_block(m, blk, var2idx, ctr2idx, link_rows)
+        self.set_var_idx(blk, v_base)
+
+        return range(v_base, v_base + len(blk.var_names))
+
+    def set_var_idx(self, blk, v_base):
         """
+        Record the index of self's variables in the model.
+
+        The same is done for the devices whose blocks are part of `blk`.
+
+        Args:
+            blk: self's CooBlock
+            v_base: index of the block's first variable in the model
+        """
+        self.var_idx = {
+            g: v_base + idx for g, idx in blk.var_groups.items()
+        }
+        for d, child, offset in blk.children:
+            d.set_var_idx(child, v_base + offset)
 
         return
 
+    def template_signature(
+        self,
+        time_window=[],
+        binaries=True
+    ):
+        """
+        Describe the structure of self's model.
+
+        Two devices with the same signature have models with the same number
+            of variables and constraints, the same variable types and
+            constraint senses, and the same sparsity pattern: only names,
+            bounds, right-hand sides and coefficient values may differ.
+        Child classes whose structure depends on their parameters must extend
+            this signature.
+
+        Args:
+            time_window: a list of the time indices [0, ..., T-1]
+            binaries: boolean that indicates whether binary requirements are to
+                be enforced or not.
+
+        Returns:
+            sig: a hashable signature
+        """
+        return (type(self).__name__, len(time_window), bool(binaries))
+
+    def link_rhs(
+        self,
+        time_window=[]
+    ):
+        """
+        Contribution of self to the right-hand side of net load linking
+            constraints.
+
+        It must match the `link_rhs` of self's COO block. Child classes with
+            fixed terms, e.g. fixed loads, must override this method.
+
+        Args:
+            time_window: a list of the time indices [0, ..., T-1]
+
+        Returns:
+            rhs: float array of shape (T,), or None if self does not
+                contribute to the right-hand side
+        """
+        return None
+
+    def coo_matrix(
+        self,
+        time_window=[],
+        delta_t=1,
+        r_label='',
+        binaries=True,
+        v_base=0,
+        n_var=None
+    ):
+        """
+        Build self's constraint matrix, in scipy.sparse format.
+
+        Linking coefficients are not part of the matrix.
+
+        Args:
+            time_window, delta_t, r_label, binaries: see `to_coo`
+            v_base: column of self's first variable in the matrix
+            n_var: total number of columns of the matrix; defaults to `v_base`
+                plus the number of self's variables
+
+        Returns:
+            A: constraint matrix, in CSR format
+            lb: lower bound of each row (-inf for 'L' constraints)
+            ub: upper bound of each row (+inf for 'G' constraints)
+            senses: sense of each constraint
+        """
+        blk = self.to_coo(
+            time_window=time_window,
+            delta_t=delta_t,
+            r_label=r_label,
+            binaries=binaries
+        )
+        return _block_matrix(blk, v_base=v_base, n_var=n_var)
+
+    def update_in_place(
+        self,
+        m,
+        v_base=0,
+        c_base=0,
+        var2idx=None,
+        ctr2idx=None,
+        time_window=[],
+        delta_t=1,
+        r_label='',
+        binaries=True,
+        link_rows=None
+    ):
+        """
+        Overwrite, with self's model, a model with the same signature.
+
+        `m` must already contain, at columns `v_base, ...` and rows
+            `c_base, ...`, the model of a device with the same template
+            signature, e.g. because `m` is a copy of a template model. Only
+            names, bounds, right-hand sides and coefficients are modified.
+        The right-hand side of linking constraints is not modified, thus self's
+            block must not contribute to it; households satisfy this.
+
+        Args:
+            m: CPLEX instance, modified in-place
+            v_base: index of the first variable of the block in `m`
+            c_base: index of the first constraint of the block in `m`
+            var2idx, ctr2idx, time_window, delta_t, r_label, binaries,
+                link_rows: see `update_model`
+
+        Returns:
+            nothing, but `m`, `var2idx` and `ctr2idx` are modified in-place
+
+        Raises:
+            ValueError: if self's block contributes to the right-hand side of
+                linking constraints, or if neither `link_rows` nor `ctr2idx`
+                is given
+        """
+        blk = self.to_coo(
+            time_window=time_window,
+            delta_t=delta_t,
+            r_label=r_label,
+            binaries=binaries
+        )
+        if blk.link_rhs is not None:
+            raise ValueError(
+                f'{self.label}: linking right-hand sides cannot be updated'
+            )
+        if link_rows is None:
+            link_rows = _netload_rows(
+                ctr2idx, time_window, r_label, self.link_name
+            )
+        v_idx = list(range(v_base, v_base + len(blk.var_names)))
+        c_idx = list(range(c_base, c_base + len(blk.ctr_names)))
+
+        # I.
+        # Variables: names and bounds
+        m.variables.set_names(list(zip(v_idx, blk.var_names)))
+        m.variables.set_lower_bounds(list(zip(v_idx, blk.lb.tolist())))
+        m.variables.set_upper_bounds(list(zip(v_idx, blk.ub.tolist())))
+        if var2idx is not None:
+            var2idx.update(zip(blk.var_names, v_idx))
+
+        # II.
+        # Constraints: names, right-hand sides and coefficients
+        m.linear_constraints.set_names(list(zip(c_idx, blk.ctr_names)))
+        m.linear_constraints.set_rhs(list(zip(c_idx, blk.rhs.tolist())))
+        if ctr2idx is not None:
+            ctr2idx.update(zip(blk.ctr_names, c_idx))
+        coefs = list(zip(
+            (c_base + blk.rows).tolist(),
+            (v_base + blk.cols).tolist(),
+            blk.vals.tolist()
+        ))
+        if len(link_rows) > 0:
+            coefs += list(zip(
+                np.asarray(link_rows, dtype=np.int64)[blk.link_t].tolist(),
+                (v_base + blk.link_cols).tolist(),
+                blk.link_vals.tolist()
+            ))
+        if coefs:
+            m.linear_constraints.set_coefficients(coefs)
+
+        self.set_var_idx(blk, v_base)
+
+        return
+
+    def to_coo(
+        self,
+        time_window=[],
+        delta_t=1,
+        r_label='',
+        binaries=True
+    ):
+        """
+        Build self's variables and constraints, in COO format.
+
+        This function must be implemented in all child classes.
+
+        Args:
+            time_window: a list of the time indices [0, ..., T-1]
+            delta_t: duration of each time-step, in hours
+            r_label: label of the resource owning that device.
+            binaries: boolean that indicates whether binary requirements are to
+                be enforced or not.
+
+            Returns:
+                blk: a CooBlock, whose time index `t` in the linking
+                    coefficients refers to `time_window[t]`
+
+            Raises:
+        """
+
+        return CooBlock()
+
 
 class FixedLoad(Device):
     """
@@ -94,22 +754,19 @@ class FixedLoad(Device):
         """
 
         Device.__init__(self, label=label)
-        self.load = fixed_load
+        self.load = np.ascontiguousarray(fixed_load, dtype=np.float64)
 
         return
 
-    def update_model(
+    def to_coo(
         self,
-        m,
-        var2idx={},
-        ctr2idx={},
         time_window=[],
         delta_t=1,
         r_label='',
         binaries=True
     ):
         """
-        Add self to household model.
+        Build self's model.
 
         """
 
@@ -118,23 +775,94 @@ class FixedLoad(Device):
         # - <HH_net_load> + \sum_{D} <D_net_load> = 0
         # so the negative load is added to the rhs:
         # - <HH_net_load> + \sum_{D} <D_net_load> = - <fixed_load>
+        return CooBlock(link_rhs=self.link_rhs(time_window))
 
-        # get right-hand side of linking constraints for net load
-        rhs = np.array(m.linear_constraints.get_rhs(
-            [ctr2idx[r_label+'link_netLoad_'+str(t)] for t in time_window]
-        ))
-        rhs -= self.load
-        m.linear_constraints.set_rhs(
-            [
-                (
-                    ctr2idx[r_label+'link_netLoad_'+str(t)],
-                    rhs[t]
-                )
-                for t in time_window
-            ]
-        )
+    def link_rhs(
+        self,
+        time_window=[]
+    ):
+        """
+        Contribution of self to the right-hand side of net load linking
+            constraints, i.e., minus the fixed load.
 
-        return
+        """
+        return -self.load
+
+
+@njit(cache=True)
+def _set_coef(rows, cols, vals, k, row, col, val):
+    """Write one coefficient at position k of COO arrays; return k+1."""
+    rows[k] = row
+    cols[k] = col
+    vals[k] = val
+    return k + 1
+
+
+@njit(cache=True)
+def _battery_coo(
+    T,
+    col_base_chg, col_base_dis, col_base_soc, col_base_cind, col_base_dind,
+    row_base,
+    eta, delta_t, eff_chg, eff_dis,
+    pwr_chg_min, pwr_chg_max, pwr_dis_min, pwr_dis_max,
+    rows, cols, vals
+):
+    """
+    Fill the COO arrays of a battery's constraints, in a single pass.
+
+    Constraints are, in that order and with T rows each: conservation of
+        energy, charging bounds (min, then max), discharging bounds (min, then
+        max) and charge/discharge binary constraint.
+    Variable <x_t> of a group has column <col_base_x> + t.
+
+    Returns:
+        the number of coefficients written
+    """
+    k = 0
+
+    # Conservation of energy
+    # <soc_t> =
+    #           <soc_{t-1}> * <eta>   (<soc_init> * <eta>, in rhs, if t=0)
+    #           + <delta_t> * <eff_chg> * <pwr_chg_t>
+    #           - <delta_t> * 1/<eff_dis> * <pwr_dis_t>
+    a = - delta_t * eff_chg
+    b = + delta_t / eff_dis
+    c = - eta
+    for t in range(T):
+        r = row_base + t
+        k = _set_coef(rows, cols, vals, k, r, col_base_soc + t, 1.)
+        if t > 0:
+            k = _set_coef(rows, cols, vals, k, r, col_base_soc + t - 1, c)
+        k = _set_coef(rows, cols, vals, k, r, col_base_chg + t, a)
+        k = _set_coef(rows, cols, vals, k, r, col_base_dis + t, b)
+
+    # Charging and discharging bounds
+    # u_chg[t] * pwr_chg_min <= pwr_chg <= u_chg[t] * p_chg_max
+    # u_dis[t] * pwr_dis_min <= pwr_dis <= u_dis[t] * p_dis_max
+    for t in range(T):
+        r = row_base + T + t
+        k = _set_coef(rows, cols, vals, k, r, col_base_chg + t, -1.)
+        k = _set_coef(rows, cols, vals, k, r, col_base_cind + t, pwr_chg_min)
+    for t in range(T):
+        r = row_base + 2*T + t
+        k = _set_coef(rows, cols, vals, k, r, col_base_chg + t, 1.)
+        k = _set_coef(rows, cols, vals, k, r, col_base_cind + t, -pwr_chg_max)
+    for t in range(T):
+        r = row_base + 3*T + t
+        k = _set_coef(rows, cols, vals, k, r, col_base_dis + t, -1.)
+        k = _set_coef(rows, cols, vals, k, r, col_base_dind + t, pwr_dis_min)
+    for t in range(T):
+        r = row_base + 4*T + t
+        k = _set_coef(rows, cols, vals, k, r, col_base_dis + t, 1.)
+        k = _set_coef(rows, cols, vals, k, r, col_base_dind + t, -pwr_dis_max)
+
+    # Charge/discharge binary constraint
+    for t in range(T):
+        r = row_base + 5*T + t
+        k = _set_coef(rows, cols, vals, k, r, col_base_cind + t, 1.)
+        k = _set_coef(rows, cols, vals, k, r, col_base_dind + t, 1.)
+
+    return k
 
 
 class Battery(Device):
@@ -203,324 +931,217 @@ class Battery(Device):
 
         return
 
-    def update_model(
+    @classmethod
+    def codegen(
+        cls,
+        T
+    ):
+        """
+        Generate the source of a battery's fill function, for horizon T.
+
+        The generated function writes the COO triplets of a battery's
+            constraints, in the same order as `_battery_coo`, with all loops
+            unrolled and all indices folded into constants. Its arguments are
+            `rows, cols, vals, col_base, row_base, eta, delta_t, eff_chg,
+            eff_dis, pwr_chg_min, pwr_chg_max, pwr_dis_min, pwr_dis_max`, and
+            it returns the number of coefficients written.
+        Constraints do not depend on whether binary requirements are
+            enforced, thus a single function serves both cases.
+
+        Args:
+            T: number of time steps
+
+        Returns:
+            name: name of the generated function
+            src: source code of the generated function
+        """
+        # (row, column, value) of each coefficient, with columns in the order
+        # pwr_chg, pwr_dis, soc, chg_ind, dis_ind
+        coefs = []
+        # Conservation of energy
+        for t in range(T):
+            coefs.append((t, 2*T + t, '1.'))
+            if t > 0:
+                coefs.append((t, 2*T + t - 1, 'c'))
+            coefs.append((t, t, 'a'))
+            coefs.append((t, T + t, 'b'))
+        # Charging and discharging bounds
+        for t in range(T):
+            coefs += [(T + t, t, '-1.'), (T + t, 3*T + t, 'pwr_chg_min')]
+        for t in range(T):
+            coefs += [(2*T + t, t, '1.'), (2*T + t, 3*T + t, '-pwr_chg_max')]
+        for t in range(T):
+            r = 3*T + t
+            coefs += [(r, T + t, '-1.'), (r, 4*T + t, 'pwr_dis_min')]
+        for t in range(T):
+            r = 4*T + t
+            coefs += [(r, T + t, '1.'), (r, 4*T + t, '-pwr_dis_max')]
+        # Charge/discharge binary constraint
+        for t in range(T):
+            coefs += [(5*T + t, 3*T + t, '1.'), (5*T + t, 4*T + t, '1.')]
+
+        name = f'_battery_fill_T{T}'
+        lines = [
+            f'def {name}(',
+            '    rows, cols, vals, col_base, row_base,',
+            '    eta, delta_t, eff_chg, eff_dis,',
+            '    pwr_chg_min, pwr_chg_max, pwr_dis_min, pwr_dis_max',
+            '):',
+            '    a = - delta_t * eff_chg',
+            '    b = + delta_t / eff_dis',
+            '    c = - eta',
+        ]
+        for k, (row, col, val) in enumerate(coefs):
+            lines.append(f'    rows[{k}] = row_base + {row}')
+            lines.append(f'    cols[{k}] = col_base + {col}')
+            lines.append(f'    vals[{k}] = {val}')
+        lines.append(f'    return {len(coefs)}')
+
+        return name, '\n'.join(lines) + '\n'
+
+    @classmethod
+    def fill_function(
+        cls,
+        T
+    ):
+        """
+        Compile, or retrieve from cache, the fill function generated by
+            `codegen`.
+
+        Functions are compiled once per (class, T), then reused for all
+            batteries with the same horizon.
+        """
+        key = (cls.__name__, T)
+        if key not in _fill_cache:
+            name, src = cls.codegen(T)
+            namespace = {}
+            exec(compile(src, f'<{name}>', 'exec'), namespace)
+            _fill_cache[key] = namespace[name]
+
+        return _fill_cache[key]
+
+    def to_coo(
         self,
-        m,
-        var2idx={},
-        ctr2idx={},
         time_window=[],
         delta_t=1,
         r_label='',
         binaries=True
     ):
         """
-        Add self to model
+        Build self's model.
 
         Parameters
         ----------
 
         """
+        T = len(time_window)
+        # time indices, as strings, for variable and constraint names
+        t_strs = [str(t) for t in time_window]
+        # prefix of self's variable and constraint names
+        pfx = f'{r_label}{self.label}'
+        t_arr = np.asarray(time_window, dtype=np.int64)
 
         # I.
-        # Add variables
-
-        # battery charging power
-        # bounds are tackle by the on-off indicator
-        v_idx = m.variables.add(
-            names=[r_label+self.label+'_pwr_chg_'+str(t) for t in time_window],
-            columns=[
-                cplex.SparsePair(
-                    ind=[ctr2idx[r_label+'link_netLoad_'+str(t)]],
-                    val=[1]
-                )
-                for t in time_window
-            ]
-        )
-        var2idx.update(dict(zip(
-            [r_label+self.label+'_pwr_chg_'+str(t) for t in time_window],
-            v_idx
-        )))
-
-        # battery discharging power
-        # bounds are tackle by the on-off indicator
-        v_idx = m.variables.add(
-            names=[r_label+self.label+'_pwr_dis_'+str(t) for t in time_window],
-            columns=[
-                cplex.SparsePair(
-                    ind=[ctr2idx[r_label+'link_netLoad_'+str(t)]],
-                    val=[-1]
-                )
-                for t in time_window
-            ]
+        # Variables
+        # Column indices of each group of variables
+        pwr_chg_idx = t_arr  # battery charging power
+        pwr_dis_idx = T + t_arr  # battery discharging power
+        soc_idx = 2*T + t_arr  # state-of-charge
+        chg_ind_idx = 3*T + t_arr  # battery charging indicator
+        dis_ind_idx = 4*T + t_arr  # battery discharging indicator
+
+        var_names = (
+            [f'{pfx}_pwr_chg_{s}' for s in t_strs]
+            + [f'{pfx}_pwr_dis_{s}' for s in t_strs]
+            + [f'{pfx}_soc_{s}' for s in t_strs]
+            + [f'{pfx}_chg_ind_{s}' for s in t_strs]
+            + [f'{pfx}_dis_ind_{s}' for s in t_strs]
         )
-        var2idx.update(dict(zip(
-            [r_label+self.label+'_pwr_dis_'+str(t) for t in time_window],
-            v_idx
-        )))
+        # power bounds are tackled by the on-off indicators
+        lb = np.zeros(5*T)
+        ub = np.full(5*T, cplex.infinity)
+        lb[soc_idx] = self.soc_min
+        ub[soc_idx] = self.soc_max
+        ub[chg_ind_idx] = 1
+        ub[dis_ind_idx] = 1
+        types = 'C' * 3*T + ('B' if binaries else 'C') * 2*T
 
-        # state-of-charge
-        v_idx = m.variables.add(
-            names=[r_label+self.label+'_soc_'+str(t) for t in time_window],
-            lb=[self.soc_min for t in time_window],
-            ub=[self.soc_max for t in time_window]
+        # II.
+        # Constraints
+        # self-discharge factor, as a Python float
+        eta = float(np.exp(-np.log(2) * delta_t / self.half_life))
+
+        # Row indices of each group of constraints, in the order expected by
+        # `_battery_coo`
+        ener_rows = t_arr  # conservation of energy
+        bin_rows = 5*T + t_arr  # charge/discharge binary constraint
+
+        ctr_names = (
+            [f'{pfx}_ener_cons_{s}' for s in t_strs]
+            + [f'{pfx}_pwr_chg_min_{s}' for s in t_strs]
+            + [f'{pfx}_pwr_chg_max_{s}' for s in t_strs]
+            + [f'{pfx}_pwr_dis_min_{s}' for s in t_strs]
+            + [f'{pfx}_pwr_dis_max_{s}' for s in t_strs]
+            + [f'{pfx}_cstr_bin_{s}' for s in t_strs]
         )
-        var2idx.update(dict(zip(
-            [r_label+self.label+'_soc_'+str(t) for t in time_window],
-            v_idx
-        )))
-
-        # battery charging indicator
-        if binaries:
-            v_idx = m.variables.add(
-                names=[
-                    r_label+self.label+'_chg_ind_'+str(t)
-                    for t in time_window
-                ],
-                types=['B' for t in time_window]
+        senses = 'E' * T + 'L' * 5*T
+        rhs = np.zeros(6*T)
+        rhs[ener_rows[0]] = eta * self.soc_init
+        rhs[bin_rows] = 1
+
+        nnz = 3 + 4*(T-1) + 10*T
+        rows = np.empty(nnz, dtype=np.int64)
+        cols = np.empty(nnz, dtype=np.int64)
+        vals = np.empty(nnz, dtype=np.float64)
+        if HAS_NUMBA:
+            # scalars are cast so that a single compiled specialization is
+            # used
+            _battery_coo(
+                T,
+                int(pwr_chg_idx[0]), int(pwr_dis_idx[0]), int(soc_idx[0]),
+                int(chg_ind_idx[0]), int(dis_ind_idx[0]),
+                int(ener_rows[0]),
+                eta, float(delta_t),
+                float(self.eff_chg), float(self.eff_dis),
+                float(self.pwr_chg_min), float(self.pwr_chg_max),
+                float(self.pwr_dis_min), float(self.pwr_dis_max),
+                rows, cols, vals
             )
-            var2idx.update(dict(zip(
-                [r_label+self.label+'_chg_ind_'+str(t) for t in time_window],
-                v_idx
-            )))
-
-            # battery discharging indicator
-            v_idx = m.variables.add(
-                names=[
-                    r_label+self.label+'_dis_ind_'+str(t)
-                    for t in time_window
-                ],
-                types=['B' for t in time_window]
-            )
-            var2idx.update(dict(zip(
-                [r_label+self.label+'_dis_ind_'+str(t) for t in time_window],
-                v_idx
-            )))
         else:
-            v_idx = m.variables.add(
-                names=[
-                    r_label+self.label+'_chg_ind_'+str(t)
-                    for t in time_window
-                ],
-                lb=[0 for t in time_window],
-                ub=[1 for t in time_window]
-            )
-            var2idx.update(dict(zip(
-                [r_label+self.label+'_chg_ind_'+str(t) for t in time_window],
-                v_idx
-            )))
-
-            # battery discharging indicator
-            v_idx = m.variables.add(
-                names=[
-                    r_label+self.label+'_dis_ind_'+str(t)
-                    for t in time_window
-                ],
-                lb=[0 for t in time_window],
-                ub=[1 for t in time_window]
+            # without numba, use the fill function specialized for T
+            fill = Battery.fill_function(T)
+            fill(
+                rows, cols, vals,
+                int(pwr_chg_idx[0]), int(ener_rows[0]),
+                eta, delta_t, self.eff_chg, self.eff_dis,
+                self.pwr_chg_min, self.pwr_chg_max,
+                self.pwr_dis_min, self.pwr_dis_max
             )
-            var2idx.update(dict(zip(
-                [r_label+self.label+'_dis_ind_'+str(t) for t in time_window],
-                v_idx
-            )))
-
-        # II.
-        # Add constraints
-        eta = np.exp(-np.log(2) * delta_t / self.half_life)
-
-        # Conservation of energy at time t=0
-        # <soc_0> =
-        #           <soc_init> * <eta>
-        #           + <delta_t> * <eff_chg> * <pwr_chg_t>
-        #           - <delta_t> * 1/<eff_dis> * <pwr_dis_t>
-        c_idx = m.linear_constraints.add(
-            names=[r_label+self.label+'_ener_cons_0'],
-            senses=['E'],
-            rhs=[eta * self.soc_init],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_soc_0'],
-                        var2idx[r_label+self.label+'_pwr_chg_0'],
-                        var2idx[r_label+self.label+'_pwr_dis_0']
-                    ],
-                    val=[
-                        1,
-                        - delta_t * self.eff_chg,
-                        + delta_t / self.eff_dis
-                    ]
-                )
-            ]
-        )
-        ctr2idx.update(dict(zip(
-            [r_label+self.label+'_ener_cons_0'],
-            c_idx
-        )))
-        # Conservation of energy at time t>0
-        # <soc_t> =
-        #           <soc_{t-1}> * <eta>
-        #           + <delta_t> * <eff_chg> * <pwr_chg_t>
-        #           - <delta_t> * 1/<eff_dis> * <pwr_dis_t>
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_ener_cons_'+str(t)
-                for t in time_window[1:]
-            ],
-            senses=['E' for t in time_window[1:]],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_soc_'+str(t)],
-                        var2idx[r_label+self.label+'_soc_'+str(t-1)],
-                        var2idx[r_label+self.label+'_pwr_chg_'+str(t)],
-                        var2idx[r_label+self.label+'_pwr_dis_'+str(t)]
-                    ],
-                    val=[
-                        1,
-                        - eta,
-                        - delta_t * self.eff_chg,
-                        + delta_t / self.eff_dis
-                    ]
-                )
-                for t in time_window[1:]
-            ]
-        )
-        ctr2idx.update(dict(zip(
-            [r_label+self.label+'_ener_cons_'+str(t) for t in time_window[1:]],
-            c_idx
-        )))
-
-        # Charging bounds
-        # u_chg[t] * pwr_chg_min <= pwr_chg <= u_chg[t] * p_chg_max
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_pwr_chg_min_'+str(t)
-                for t in time_window
-            ],
-            senses=['L' for t in time_window],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_pwr_chg_'+str(t)],
-                        var2idx[r_label+self.label+'_chg_ind_'+str(t)]
-                    ],
-                    val=[
-                        -1,
-                        1 * self.pwr_chg_min
-                    ]
-                )
-                for t in time_window
-            ]
-        )
-        ctr2idx.update(dict(zip(
-            [r_label+self.label+'_pwr_chg_min_'+str(t) for t in time_window],
-            c_idx
-        )))
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_pwr_chg_max_'+str(t)
-                for t in time_window
-            ],
-            senses=['L' for t in time_window],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_pwr_chg_'+str(t)],
-                        var2idx[r_label+self.label+'_chg_ind_'+str(t)]
-                    ],
-                    val=[
-                        1,
-                        -1 * self.pwr_chg_max
-                    ]
-                )
-                for t in time_window
-            ]
-        )
-        ctr2idx.update(dict(zip(
-            [r_label+self.label+'_pwr_chg_max_'+str(t) for t in time_window],
-            c_idx
-        )))
-
-        # Discharging bounds
-        # u_dis[t] * pwr_dis_min <= pwr_dis <= u_dis[t] * p_dis_max
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_pwr_dis_min_'+str(t)
-                for t in time_window
-            ],
-            senses=['L' for t in time_window],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_pwr_dis_'+str(t)],
-                        var2idx[r_label+self.label+'_dis_ind_'+str(t)]
-                    ],
-                    val=[
-                        -1,
-                        1 * self.pwr_dis_min
-                    ]
-                )
-                for t in time_window
-            ]
-        )
-        ctr2idx.update(dict(zip(
-            [r_label+self.label+'_pwr_dis_min_'+str(t) for t in time_window],
-            c_idx
-        )))
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_pwr_dis_max_'+str(t)
-                for t in time_window
-            ],
-            senses=['L' for t in time_window],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_pwr_dis_'+str(t)],
-                        var2idx[r_label+self.label+'_dis_ind_'+str(t)]
-                    ],
-                    val=[
-                        1,
-                        -1 * self.pwr_dis_max
-                    ]
-                )
-                for t in time_window
-            ]
-        )
-        ctr2idx.update(dict(zip(
-            [r_label+self.label+'_pwr_dis_max_'+str(t) for t in time_window],
-            c_idx
-        )))
-
-        # Charge/discharge binary constraint
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_cstr_bin_'+str(t)
-                for t in time_window
-            ],
-            senses=['L' for t in time_window],
-            rhs=[1 for t in time_window],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_chg_ind_'+str(t)],
-                        var2idx[r_label+self.label+'_dis_ind_'+str(t)]
-                    ],
-                    val=[
-                        1,
-                        1
-                    ]
-                )
-                for t in time_window
-            ]
-        )
-        ctr2idx.update(dict(zip(
-            [r_label+self.label+'_cstr_bin_'+str(t) for t in time_window],
-            c_idx
-        )))
 
         # Done
-
-        return
+        return CooBlock(
+            var_names=var_names,
+            lb=lb,
+            ub=ub,
+            types=types,
+            ctr_names=ctr_names,
+            senses=senses,
+            rhs=rhs,
+            rows=rows,
+            cols=cols,
+            vals=vals,
+            # charging power is a load, discharging power a generation
+            link_t=np.concatenate([t_arr, t_arr]),
+            link_cols=np.concatenate([pwr_chg_idx, pwr_dis_idx]),
+            link_vals=np.concatenate([np.ones(T), -np.ones(T)]),
+            var_groups={
+                'pwr_chg': pwr_chg_idx,
+                'pwr_dis': pwr_dis_idx,
+                'soc': soc_idx,
+                'chg_ind': chg_ind_idx,
+                'dis_ind': dis_ind_idx
+            }
+        )
 
 
 class ThermalLoad(Device):
@@ -567,9 +1188,9 @@ class ThermalLoad(Device):
         """
         Device.__init__(self, label=label)
 
-        self.temp_min = temp_min
-        self.temp_max = temp_max
-        self.temp_ext = temp_ext
+        self.temp_min = np.ascontiguousarray(temp_min, dtype=np.float64)
+        self.temp_max = np.ascontiguousarray(temp_max, dtype=np.float64)
+        self.temp_ext = np.ascontiguousarray(temp_ext, dtype=np.float64)
         self.temp_init = temp_init
         self.pwr_th_min = pwr_th_min
         self.pwr_th_max = pwr_th_max
@@ -579,200 +1200,117 @@ class ThermalLoad(Device):
 
         return
 
-    def update_model(
+    def to_coo(
         self,
-        m,
-        var2idx,
-        ctr2idx,
-        time_window,
-        delta_t,
+        time_window=[],
+        delta_t=1,
         r_label='',
         binaries=True
     ):
         """
-        Add self to model
+        Build self's model.
 
         """
+        T = len(time_window)
+        # time indices, as strings, for variable and constraint names
+        t_strs = [str(t) for t in time_window]
+        # prefix of self's variable and constraint names
+        pfx = f'{r_label}{self.label}'
+        t_arr = np.asarray(time_window, dtype=np.int64)
 
         # I
-        # Add variables.
-
-        # thermal power
-        v_idx = m.variables.add(
-            names=[r_label+self.label+'_pwr_'+str(t) for t in time_window],
-            columns=[
-                cplex.SparsePair(
-                    ind=[ctr2idx[r_label+'link_netLoad_'+str(t)]],
-                    val=[1]
-                )
-                for t in time_window
-            ]
+        # Variables.
+        pwr_idx = t_arr  # thermal power
+        temp_idx = T + t_arr  # temperature
+        on_idx = 2*T + t_arr  # on-off coefficient
+
+        var_names = (
+            [f'{pfx}_pwr_{s}' for s in t_strs]
+            + [f'{pfx}_temp_{s}' for s in t_strs]
+            + [f'{pfx}_on_ind_{s}' for s in t_strs]
         )
-        var2idx.update(dict(zip(
-            [r_label+self.label+'_pwr_'+str(t) for t in time_window],
-            v_idx
-        )))
+        lb = np.zeros(3*T)
+        ub = np.full(3*T, cplex.infinity)
+        lb[temp_idx] = self.temp_min
+        ub[temp_idx] = self.temp_max
+        ub[on_idx] = 1
+        # if binaries is False, the binary condition is relaxed
+        types = 'C' * 2*T + ('B' if binaries else 'C') * T
 
-        # temperature
-        v_idx = m.variables.add(
-            names=[r_label+self.label+'_temp_'+str(t) for t in time_window],
-            lb=self.temp_min,
-            ub=self.temp_max
+        # II.
+        # Constraints
+        pwr_min_rows = t_arr  # bounds on thermal power
+        pwr_max_rows = T + t_arr
+        exch_rows = 2*T + t_arr  # temperature exchange
+
+        ctr_names = (
+            [f'{pfx}_pwr_th_min_{s}' for s in t_strs]
+            + [f'{pfx}_pwr_th_max_{s}' for s in t_strs]
+            + [f'{pfx}_temp_exch_{s}' for s in t_strs]
         )
-        var2idx.update(dict(zip(
-            [r_label+self.label+'_temp_'+str(t) for t in time_window],
-            v_idx
-        )))
-
-        # on-off coefficient
-        if binaries:
-            # on-off is binary variable
-            v_idx = m.variables.add(
-                names=[
-                    r_label+self.label+'_on_ind_'+str(t) for t in time_window
-                ],
-                types=['B' for t in time_window]
-            )
-            var2idx.update(dict(zip(
-                [r_label+self.label+'_on_ind_'+str(t) for t in time_window],
-                v_idx
-            )))
-        else:
-            # binary condition is relaxed
-            v_idx = m.variables.add(
-                names=[
-                    r_label+self.label+'_on_ind_'+str(t) for t in time_window
-                ],
-                lb=[0 for t in time_window],
-                ub=[1 for t in time_window]
-            )
-            var2idx.update(dict(zip(
-                [r_label+self.label+'_on_ind_'+str(t) for t in time_window],
-                v_idx
-            )))
+        # Coefficients of the temperature exchange
+        # <temp_t> = <temp_{t-1}> * (1 - <k>) + <k> * <temp_ext_t>
+        #           + <delta_t> * <th_eff> / <heat_cpty> * <pwr_t>
+        k_cond = delta_t * (self.cond_coeff / self.heat_cpty)
+        alpha = - (1. - k_cond)
+        beta = - delta_t * (self.th_eff / self.heat_cpty)
+
+        senses = 'L' * 2*T + 'E' * T
+        rhs = np.zeros(3*T)
+        rhs[exch_rows[0]] = (
+            self.temp_init + k_cond * (self.temp_ext[0] - self.temp_init)
+        )
+        rhs[exch_rows[1:]] = k_cond * self.temp_ext[t_arr[1:]]
 
-        # II.
-        # Add constraints
+        nnz = 4*T + 2 + 3*(T-1)
+        coo = (
+            np.empty(nnz, dtype=np.int64),
+            np.empty(nnz, dtype=np.int64),
+            np.empty(nnz, dtype=np.float64)
+        )
+        k = 0
 
         # bounds on thermal power
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_pwr_th_min_'+str(t)
-                for t in time_window
-            ],
-            senses=['L' for t in time_window],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_pwr_'+str(t)],
-                        var2idx[r_label+self.label+'_on_ind_'+str(t)]
-                    ],
-                    val=[
-                        -1,
-                        1 * self.pwr_th_min
-                    ]
-                )
-                for t in time_window
-            ]
-        )
-        ctr2idx.update(dict(zip(
-            [r_label+self.label+'_pwr_th_min_'+str(t) for t in time_window],
-            c_idx
-        )))
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_pwr_th_max_'+str(t)
-                for t in time_window
-            ],
-            senses=['L' for t in time_window],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_pwr_'+str(t)],
-                        var2idx[r_label+self.label+'_on_ind_'+str(t)]
-                    ],
-                    val=[
-                        1,
-                        -1 * self.pwr_th_max
-                    ]
-                )
-                for t in time_window
-            ]
+        pwr_on = np.stack([pwr_idx, on_idx], axis=1)
+        k = _put_rows(
+            coo, k,
+            np.concatenate([pwr_min_rows, pwr_max_rows]),
+            np.concatenate([pwr_on, pwr_on]),
+            np.repeat(
+                [[-1, 1 * self.pwr_th_min], [1, -1 * self.pwr_th_max]],
+                T, axis=0
+            )
         )
-        ctr2idx.update(dict(zip(
-            [r_label+self.label+'_pwr_th_max_'+str(t) for t in time_window],
-            c_idx
-        )))
 
         # Temperature exchange for t=0
-        c_idx = m.linear_constraints.add(
-            names=[r_label+self.label+'_temp_exch_0'],
-            senses=['E'],
-            rhs=[
-                self.temp_init
-                + delta_t * (self.cond_coeff / self.heat_cpty)
-                * (self.temp_ext[0] - self.temp_init)
-            ],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_temp_0'],
-                        var2idx[r_label+self.label+'_pwr_0']
-                    ],
-                    val=[
-                        1,
-                        - delta_t * (self.th_eff / self.heat_cpty),
-                    ]
-                )
-            ]
+        k = _put_rows(
+            coo, k, exch_rows[:1],
+            np.stack([temp_idx[:1], pwr_idx[:1]], axis=1),
+            [1, beta]
         )
-        ctr2idx.update(dict(zip(
-            [r_label+self.label+'_temp_exch_0'],
-            c_idx
-        )))
-
         # Temperature exchange for t>0
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_temp_exch_'+str(t)
-                for t in time_window[1:]
-            ],
-            senses=['E' for t in time_window[1:]],
-            rhs=[
-                (
-                    delta_t * (self.cond_coeff / self.heat_cpty)
-                    * self.temp_ext[t]
-                )
-                for t in time_window[1:]
-            ],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_temp_'+str(t)],
-                        var2idx[r_label+self.label+'_temp_'+str(t-1)],
-                        var2idx[r_label+self.label+'_pwr_'+str(t)]
-                    ],
-                    val=[
-                        1,
-                        - (
-                            1.
-                            - delta_t * (self.cond_coeff / self.heat_cpty)
-                        ),
-                        - delta_t * (self.th_eff / self.heat_cpty),
-                    ]
-                )
-                for t in time_window[1:]
-            ]
+        k = _put_rows(
+            coo, k, exch_rows[1:],
+            np.stack([temp_idx[1:], temp_idx[:-1], pwr_idx[1:]], axis=1),
+            [1, alpha, beta]
         )
-        ctr2idx.update(dict(zip(
-            [
-                r_label+self.label+'_temp_exch_'+str(t)
-                for t in time_window[1:]
-            ],
-            c_idx
-        )))
 
-        return
+        return CooBlock(
+            var_names=var_names,
+            lb=lb,
+            ub=ub,
+            types=types,
+            ctr_names=ctr_names,
+            senses=senses,
+            rhs=rhs,
+            rows=coo[0],
+            cols=coo[1],
+            vals=coo[2],
+            link_t=t_arr,
+            link_cols=pwr_idx,
+            link_vals=np.ones(T),
+            var_groups={'pwr': pwr_idx, 'temp': temp_idx, 'on_ind': on_idx}
+        )
 
 
 class DeferrableLoad(Device):
@@ -796,560 +1334,1081 @@ class DeferrableLoad(Device):
 
         Device.__init__(self, label=label)
 
-        self.pwr_min = pwr_min
-        self.pwr_max = pwr_max
+        self.pwr_min = np.ascontiguousarray(pwr_min, dtype=np.float64)
+        self.pwr_max = np.ascontiguousarray(pwr_max, dtype=np.float64)
         self.energy_min = energy_min
         self.energy_max = energy_max
 
         return
 
-    def update_model(
+    def to_coo(
+        self,
+        time_window=[],
+        delta_t=1,
+        r_label='',
+        binaries=True
+    ):
+        """
+        Build self's model.
+
+        """
+        T = len(time_window)
+        # time indices, as strings, for variable and constraint names
+        t_strs = [str(t) for t in time_window]
+        # prefix of self's variable and constraint names
+        pfx = f'{r_label}{self.label}'
+        t_arr = np.asarray(time_window, dtype=np.int64)
+
+        # I.
+        # Variables
+        pwr_idx = t_arr  # power
+        u_idx = T + t_arr  # on-off
+
+        var_names = (
+            [f'{pfx}_pwr_{s}' for s in t_strs]
+            + [f'{pfx}_u_{s}' for s in t_strs]
+        )
+        lb = np.zeros(2*T)
+        ub = np.full(2*T, cplex.infinity)
+        ub[u_idx] = 1
+        types = 'C' * T + ('B' if binaries else 'C') * T
+
+        # II.
+        # Constraints
+        e_rows = np.array([0, 1])  # total energy requirement (min, max)
+        pwr_min_rows = 2 + t_arr  # on-off
+        pwr_max_rows = 2 + T + t_arr
+
+        ctr_names = (
+            [
+                f'{pfx}_E_tot_min',
+                f'{pfx}_E_tot_max'
+            ]
+            + [f'{pfx}_pwr_min_{s}' for s in t_strs]
+            + [f'{pfx}_pwr_max_{s}' for s in t_strs]
+        )
+        senses = 'GL' + 'L' * 2*T
+        rhs = np.zeros(2 + 2*T)
+        rhs[e_rows] = [self.energy_min, self.energy_max]
+
+        nnz = 2*T + 4*T
+        coo = (
+            np.empty(nnz, dtype=np.int64),
+            np.empty(nnz, dtype=np.int64),
+            np.empty(nnz, dtype=np.float64)
+        )
+        k = 0
+
+        # total energy requirement
+        # both rows share the same coefficients: a read-only view of a single
+        # row is broadcast over the min and max constraints
+        k = _put_rows(
+            coo, k, e_rows,
+            np.broadcast_to(pwr_idx, (2, T)),
+            delta_t
+        )
+
+        # on-off
+        # rows [0, T) are minimum power, rows [T, 2T) maximum power
+        pwr_u = np.stack([pwr_idx, u_idx], axis=1)
+        vals_pwr = np.empty((2*T, 2))
+        vals_pwr[:T, 0] = -1
+        vals_pwr[:T, 1] = self.pwr_min[t_arr]
+        vals_pwr[T:, 0] = 1
+        vals_pwr[T:, 1] = -self.pwr_max[t_arr]
+        k = _put_rows(
+            coo, k,
+            np.concatenate([pwr_min_rows, pwr_max_rows]),
+            np.concatenate([pwr_u, pwr_u]),
+            vals_pwr
+        )
+
+        # Done
+        return CooBlock(
+            var_names=var_names,
+            lb=lb,
+            ub=ub,
+            types=types,
+            ctr_names=ctr_names,
+            senses=senses,
+            rhs=rhs,
+            rows=coo[0],
+            cols=coo[1],
+            vals=coo[2],
+            link_t=t_arr,
+            link_cols=pwr_idx,
+            link_vals=np.ones(T),
+            var_groups={'pwr': pwr_idx, 'u': u_idx}
+        )
+
+
+class ShiftableLoad(Device):
+    """
+    Uninterruptible load.
+
+    """
+
+    def __init__(
+        self,
+        label='',
+        t_start_min=[],
+        t_start_max=[],
+        cycles=[[]]
+    ):
+        """
+        Class constructor
+
+        Parameters
+        ----------
+        label : string
+            Device label
+        t_start_min : array of int
+            minimum start time for each cycle
+        t_start_max : array of int
+            maximum start time for each cycle
+        cycles : list of (float array)
+            List of load profile for each cycle
+            cycles[k] is the load profile for the k-th cycle
+        """
+
+        Device.__init__(self, label=label)
+
+        self.t_start_min = t_start_min
+        self.t_start_max = t_start_max
+        self.cycles = cycles
+        # number of cycles
+        self.n_cycles = len(cycles)
+        # duration of each cycle
+        self.durations = [len(c) for c in cycles]
+
+    def _start_layout(self):
+        """
+        Sparse layout of start-up variables.
+
+        Only start times within [t_start_min[k], t_start_max[k]] are
+            materialized, ordered by cycle, then by start time. It is computed
+            from the current start-up windows, on each call.
+
+        Returns:
+            int array of shape (n_start, 2), whose row j is the pair (k, s) of
+                variable <u_k_s>
+        """
+        return np.array(
+            [
+                (k, s)
+                for k in range(self.n_cycles)
+                for s in range(self.t_start_min[k], self.t_start_max[k]+1)
+            ],
+            dtype=np.int64
+        ).reshape(-1, 2)
+
+    def template_signature(
+        self,
+        time_window=[],
+        binaries=True
+    ):
+        """
+        Describe the structure of self's model.
+
+        The structure depends on the start-up windows and on the nonzero
+            entries of each cycle profile.
+        """
+        return Device.template_signature(
+            self,
+            time_window=time_window,
+            binaries=binaries
+        ) + (
+            tuple(self._start_layout().ravel().tolist()),
+            tuple(tuple(np.flatnonzero(c).tolist()) for c in self.cycles)
+        )
+
+    def to_coo(
+        self,
+        time_window=[],
+        delta_t=1,
+        r_label='',
+        binaries=True
+    ):
+        """
+        Build self's model.
+
+        It is assumed that:
+            * There exists at least one feasible schedule.
+            * Min/Max starting times are so that each cycle is guaranteed to
+                terminate before the end of the time horizon, ie:
+                t_max[k] + L_k <= T
+
+        """
+        T = len(time_window)
+        # time indices, as strings, for variable and constraint names
+        t_strs = [str(t) for t in time_window]
+        # prefix of self's variable and constraint names
+        pfx = f'{r_label}{self.label}'
+        t_arr = np.asarray(time_window, dtype=np.int64)
+
+        # (cycle, start time) of each start-up variable
+        start_ij = self._start_layout()
+
+        # I.
+        # Variables.
+        i_pwr = 0  # power
+        pwr_idx = i_pwr + t_arr
+        # start_up for each cycle: column and start time of each variable,
+        # computed once and shared by all constraints
+        u_cols = [
+            T + np.flatnonzero(start_ij[:, 0] == k)
+            for k in range(self.n_cycles)
+        ]
+        u_times = [start_ij[u - T, 1] for u in u_cols]
+        n_start = [u.size for u in u_cols]
+        n_var = T + len(start_ij)
+
+        var_names = (
+            [f'{pfx}_pwr_{s}' for s in t_strs]
+            + [
+                f'{pfx}_u_{k}_{s}'
+                for k, s in start_ij.tolist()
+            ]
+        )
+        lb = np.zeros(n_var)
+        ub = np.full(n_var, cplex.infinity)
+        ub[T:] = 1
+        types = 'C' * T + ('B' if binaries else 'C') * (n_var - T)
+
+        # II.
+        # Constraints.
+        r_start = 0  # exactly one start_up for each cycle
+        r_net = self.n_cycles  # net power
+        r_cycle = self.n_cycles + T  # cycle k+1 starts after end of cycle k
+
+        ctr_names = (
+            [
+                f'{pfx}_start_up_{k}'
+                for k in range(self.n_cycles)
+            ]
+            + [f'{pfx}_net_power_{s}' for s in t_strs]
+            + [
+                f'{pfx}_cycle_start_{k}'
+                for k in range(1, self.n_cycles)
+            ]
+        )
+        senses = 'E' * (self.n_cycles + T) + 'G' * (self.n_cycles - 1)
+        rhs = np.zeros(len(ctr_names))
+        rhs[r_start:r_net] = 1
+        rhs[r_cycle:] = self.durations[:-1]
+
+        # net power
+        # <pwr_t> = \sum_{k, s} c_k[t-s] * <u_k_s>
+        # start-up time s of cycle k contributes to net power at times
+        # s+d, for each nonzero c_k[d], that are within the time horizon
+        net_rows = [r_net + t_arr]
+        net_cols = [pwr_idx]
+        net_vals = [np.ones(T)]
+        for k, c in enumerate(self.cycles):
+            c = np.asarray(c, dtype=np.float64)
+            d = np.flatnonzero(c)
+            t = u_times[k][:, None] + d[None, :]
+            col = np.broadcast_to(u_cols[k][:, None], t.shape)
+            in_horizon = t < T
+            net_rows.append(r_net + t[in_horizon])
+            net_cols.append(col[in_horizon])
+            net_vals.append(np.broadcast_to(- c[d], t.shape)[in_horizon])
+        net_rows = np.concatenate(net_rows)
+        net_cols = np.concatenate(net_cols)
+        net_vals = np.concatenate(net_vals)
+
+        nnz = (
+            sum(n_start)
+            + net_rows.size
+            + sum(n_start[k-1] + n_start[k] for k in range(1, self.n_cycles))
+        )
+        coo = (
+            np.empty(nnz, dtype=np.int64),
+            np.empty(nnz, dtype=np.int64),
+            np.empty(nnz, dtype=np.float64)
+        )
+        k_nz = 0
+
+        # exactly one start_up for each cycle
+        # all cycles are written at once: start-up variable j is in the row
+        # of its cycle, with coefficient 1
+        n = n_var - T
+        coo[0][k_nz:k_nz+n] = r_start + start_ij[:, 0]
+        coo[1][k_nz:k_nz+n] = T + np.arange(n)
+        coo[2][k_nz:k_nz+n] = 1
+        k_nz += n
+
+        # net power
+        n = net_rows.size
+        coo[0][k_nz:k_nz+n] = net_rows
+        coo[1][k_nz:k_nz+n] = net_cols
+        coo[2][k_nz:k_nz+n] = net_vals
+        k_nz += n
+
+        # cycle k+1 cannot start before end of cycle k
+        for k in range(1, self.n_cycles):
+            k_nz = _put_rows(
+                coo, k_nz, [r_cycle+k-1],
+                [np.concatenate([u_cols[k-1], u_cols[k]])],
+                np.concatenate([- u_times[k-1], u_times[k]])
+            )
+
+        # Done.
+        return CooBlock(
+            var_names=var_names,
+            lb=lb,
+            ub=ub,
+            types=types,
+            ctr_names=ctr_names,
+            senses=senses,
+            rhs=rhs,
+            rows=coo[0],
+            cols=coo[1],
+            vals=coo[2],
+            link_t=t_arr,
+            link_cols=pwr_idx,
+            link_vals=np.ones(T),
+            # start-up variables are ordered by cycle, then by start time
+            var_groups={
+                'pwr': pwr_idx,
+                'u': T + np.arange(n_var - T)
+            }
+        )
+
+
+class CurtailableLoad(Device):
+    """
+    Curtailable Load.
+
+    """
+
+    def __init__(
+        self,
+        label='',
+        load=[],
+        binary=True
+    ):
+        """
+        Class constructor.
+
+        """
+
+        Device.__init__(self, label=label)
+
+        #
+        self.load = np.ascontiguousarray(load, dtype=np.float64)
+        self.binary = binary
+
+    def template_signature(
+        self,
+        time_window=[],
+        binaries=True
+    ):
+        """
+        Describe the structure of self's model.
+
+        Control variables are binary only if both `binaries` and `self.binary`
+            are set.
+        """
+        return Device.template_signature(
+            self,
+            time_window=time_window,
+            binaries=(self.binary and binaries)
+        )
+
+    def to_coo(
         self,
-        m,
-        var2idx={},
-        ctr2idx={},
         time_window=[],
         delta_t=1,
         r_label='',
         binaries=True
     ):
         """
-        Add self to household model.
+        Build self's model.
 
         """
+        T = len(time_window)
+        # time indices, as strings, for variable and constraint names
+        t_strs = [str(t) for t in time_window]
+        # prefix of self's variable and constraint names
+        pfx = f'{r_label}{self.label}'
+        t_arr = np.asarray(time_window, dtype=np.int64)
 
         # I.
-        # Add variables
+        # Variables.
+        pwr_idx = t_arr  # power
+        u_idx = T + t_arr  # on-off
 
-        # power
-        v_idx = m.variables.add(
-            names=[r_label+self.label+'_pwr_'+str(t) for t in time_window],
-            columns=[
-                cplex.SparsePair(
-                    ind=[ctr2idx[r_label+'link_netLoad_'+str(t)]],
-                    val=[1]
-                )
-                for t in time_window
-            ]
+        var_names = (
+            [f'{pfx}_pwr_{s}' for s in t_strs]
+            + [f'{pfx}_u_{s}' for s in t_strs]
         )
-        var2idx.update(dict(zip(
-            [r_label+self.label+'_pwr_'+str(t) for t in time_window],
-            v_idx
-        )))
-
-        # on-off
-        if binaries:
-            v_idx = m.variables.add(
-                names=[r_label+self.label+'_u_'+str(t) for t in time_window],
-                types=['B' for t in time_window]
-            )
-            var2idx.update(dict(zip(
-                [r_label+self.label+'_u_'+str(t) for t in time_window],
-                v_idx
-            )))
-        else:
-            v_idx = m.variables.add(
-                names=[r_label+self.label+'_u_'+str(t) for t in time_window],
-                lb=[0 for t in time_window],
-                ub=[1 for t in time_window]
-            )
-            var2idx.update(dict(zip(
-                [r_label+self.label+'_u_'+str(t) for t in time_window],
-                v_idx
-            )))
+        # Load can be negative (ie generation), so a lower bound is specified
+        lb = np.zeros(2*T)
+        lb[pwr_idx] = -cplex.infinity
+        ub = np.full(2*T, cplex.infinity)
+        ub[u_idx] = 1
+        # binary control, or continuous control
+        types = 'C' * T + ('B' if (self.binary and binaries) else 'C') * T
 
         # II.
-        # Add constraints
-
-        # total energy requirement
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_E_tot_min',
-                r_label+self.label+'_E_tot_max'
-            ],
-            senses=['G', 'L'],
-            rhs=[self.energy_min, self.energy_max],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_pwr_'+str(t)]
-                        for t in time_window
-                    ],
-                    val=[
-                        delta_t
-                        for t in time_window
-                    ]
-                ),
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_pwr_'+str(t)]
-                        for t in time_window
-                    ],
-                    val=[
-                        delta_t
-                        for t in time_window
-                    ]
-                )
-            ]
-        )
-        ctr2idx.update(dict(zip(
-            [
-                r_label+self.label+'_E_tot_min',
-                r_label+self.label+'_E_tot_max'
-            ],
-            c_idx
-        )))
+        # Constraints
 
-        # on-off
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_pwr_min_'+str(t)
-                for t in time_window
-            ],
-            senses=['L' for t in time_window],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_pwr_'+str(t)],
-                        var2idx[r_label+self.label+'_u_'+str(t)]
-                    ],
-                    val=[
-                        -1,
-                        1 * self.pwr_min[t]
-                    ]
-                )
-                for t in time_window
-            ]
+        # curtailment constraint
+        ctr_names = [
+            f'{pfx}_curtail_{s}' for s in t_strs
+        ]
+        senses = 'E' * T
+        rhs = np.zeros(T)
+
+        nnz = 2*T
+        coo = (
+            np.empty(nnz, dtype=np.int64),
+            np.empty(nnz, dtype=np.int64),
+            np.empty(nnz, dtype=np.float64)
         )
-        ctr2idx.update(dict(zip(
-            [r_label+self.label+'_pwr_min_'+str(t) for t in time_window],
-            c_idx
-        )))
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_pwr_max_'+str(t)
-                for t in time_window
-            ],
-            senses=['L' for t in time_window],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_pwr_'+str(t)],
-                        var2idx[r_label+self.label+'_u_'+str(t)]
-                    ],
-                    val=[
-                        1,
-                        -1 * self.pwr_max[t]
-                    ]
-                )
-                for t in time_window
-            ]
+        k = 0
+        k = _put_rows(
+            coo, k, t_arr,
+            np.stack([pwr_idx, u_idx], axis=1),
+            np.stack(
+                [np.ones(T), -self.load[t_arr]],
+                axis=1
+            )
         )
-        ctr2idx.update(dict(zip(
-            [r_label+self.label+'_pwr_max_'+str(t) for t in time_window],
-            c_idx
-        )))
-
-        # Done
 
-        return
+        return CooBlock(
+            var_names=var_names,
+            lb=lb,
+            ub=ub,
+            types=types,
+            ctr_names=ctr_names,
+            senses=senses,
+            rhs=rhs,
+            rows=coo[0],
+            cols=coo[1],
+            vals=coo[2],
+            link_t=t_arr,
+            link_cols=pwr_idx,
+            link_vals=np.ones(T),
+            var_groups={'pwr': pwr_idx, 'u': u_idx}
+        )
 
 
-class ShiftableLoad(Device):
+class Household(Device):
     """
-    Uninterruptible load.
+    Household, i.e., a set of devices behind the same meter.
 
+    A household is a device of the aggregator: its net load variables enter
+        the aggregator's linking constraints, and its own net load linking
+        constraints gather the loads of its devices.
     """
 
+    # households are the devices of the aggregator, whose linking constraints
+    # are the total load constraints
+    link_name = 'link_total'
+
     def __init__(
         self,
         label='',
-        t_start_min=[],
-        t_start_max=[],
-        cycles=[[]]
+        devices=[],
+        netload_max=10.
     ):
         """
-        Class constructor
+        Class constructor.
 
         Parameters
         ----------
         label : string
-            Device label
-        t_start_min : array of int
-            minimum start time for each cycle
-        t_start_max : array of int
-            maximum start time for each cycle
-        cycles : list of (float array)
-            List of load profile for each cycle
-            cycles[k] is the load profile for the k-th cycle
+            Household label, e.g. 'HH_0'
+        devices : list of Device
+            the household's devices
+        netload_max : float
+            maximum net load of the household
         """
 
         Device.__init__(self, label=label)
 
-        self.t_start_min = t_start_min
-        self.t_start_max = t_start_max
-        self.cycles = cycles
-        # number of cycles
-        self.n_cycles = len(cycles)
-        # duration of each cycle
-        self.durations = [len(c) for c in cycles]
+        self.devices = devices
+        self.netload_max = netload_max
 
-    def update_model(
+        return
+
+    def template_signature(
+        self,
+        time_window=[],
+        binaries=True
+    ):
+        """
+        Describe the structure of the household's model.
+
+        The signature gathers those of the household's devices, in order.
+        """
+        return Device.template_signature(
+            self,
+            time_window=time_window,
+            binaries=binaries
+        ) + tuple(
+            d.template_signature(time_window=time_window, binaries=binaries)
+            for d in self.devices
+        )
+
+    def to_coo(
         self,
-        m,
-        var2idx={},
-        ctr2idx={},
         time_window=[],
         delta_t=1,
         r_label='',
         binaries=True
     ):
         """
-        Add self to household model.
+        Build the household's model, including that of all its devices.
 
-        It is assumed that:
-            * There exists at least one feasible schedule.
-            * Min/Max starting times are so that each cycle is guaranteed to
-                terminate before the end of the time horizon, ie:
-                t_max[k] + L_k <= T
+        The devices' blocks are stacked after the household's net load
+            variables and linking constraints, which read
+            - <HH_net_load> + \\sum_{D} <D_net_load> = - <fixed_load>
 
         """
+        T = len(time_window)
+        t_arr = np.asarray(time_window, dtype=np.int64)
+        # time indices, as strings, for variable and constraint names
+        t_strs = [str(t) for t in time_window]
+        # prefix of self's variable and constraint names
+        pfx = f'{r_label}{self.label}'
+
+        dev = _stack_blocks(
+            [
+                d.to_coo(
+                    time_window=time_window,
+                    delta_t=delta_t,
+                    r_label=f'{pfx}_',
+                    binaries=binaries
+                )
+                for d in self.devices
+            ],
+            self.devices
+        )
 
         # I.
-        # Add variables.
+        # Variables: net load, then devices
+        netload_idx = t_arr
+        var_names = (
+            [f'{pfx}_netLoad_{s}' for s in t_strs]
+            + dev.var_names
+        )
+        lb = np.concatenate([np.zeros(T), dev.lb])
+        ub = np.concatenate([np.full(T, self.netload_max), dev.ub])
+        types = 'C' * T + dev.types
 
-        # power
-        v_idx = m.variables.add(
-            names=[r_label+self.label+'_pwr_'+str(t) for t in time_window],
-            columns=[
-                cplex.SparsePair(
-                    ind=[ctr2idx[r_label+'link_netLoad_'+str(t)]],
-                    val=[1]
-                )
-                for t in time_window
-            ]
+        # II.
+        # Constraints: net load linking constraints, then devices
+        link_rows = t_arr
+        ctr_names = (
+            [f'{pfx}_link_netLoad_{s}' for s in t_strs]
+            + dev.ctr_names
         )
-        var2idx.update(dict(zip(
-            [r_label+self.label+'_pwr_'+str(t) for t in time_window],
-            v_idx
-        )))
-
-        # start_up for each cycle
-        # for k in range(self.n_cycles):
-        if binaries:
-            v_idx = m.variables.add(
-                names=[
-                    r_label+self.label+'_u_'+str(k)+'_'+str(t)
-                    for k in range(self.n_cycles)
-                    for t in range(
-                        self.t_start_min[k],
-                        self.t_start_max[k]+1
-                    )
-                ],
-                types=[
-                    'B'
-                    for k in range(self.n_cycles)
-                    for t in range(
-                        self.t_start_min[k],
-                        self.t_start_max[k]+1
-                    )
-                ]
-            )
-            var2idx.update(dict(zip(
-                [
-                    r_label+self.label+'_u_'+str(k)+'_'+str(t)
-                    for k in range(self.n_cycles)
-                    for t in range(
-                        self.t_start_min[k],
-                        self.t_start_max[k]+1
-                    )
-                ],
-                v_idx
-            )))
-        else:
-            v_idx = m.variables.add(
-                names=[
-                    r_label+self.label+'_u_'+str(k)+'_'+str(t)
-                    for k in range(self.n_cycles)
-                    for t in range(
-                        self.t_start_min[k],
-                        self.t_start_max[k]+1
-                    )
-                ],
-                lb=[
-                    0
-                    for k in range(self.n_cycles)
-                    for t in range(
-                        self.t_start_min[k],
-                        self.t_start_max[k]+1
-                    )
-                ],
-                ub=[
-                    1
-                    for k in range(self.n_cycles)
-                    for t in range(
-                        self.t_start_min[k],
-                        self.t_start_max[k]+1
-                    )
-                ]
+        senses = 'E' * T + dev.senses
+        rhs = np.concatenate([
+            dev.link_rhs if dev.link_rhs is not None else np.zeros(T),
+            dev.rhs
+        ])
+
+        # devices' linking coefficients become regular coefficients
+        rows = np.concatenate([link_rows, link_rows[dev.link_t], T + dev.rows])
+        cols = np.concatenate([netload_idx, T + dev.link_cols, T + dev.cols])
+        vals = np.concatenate([-np.ones(T), dev.link_vals, dev.vals])
+
+        return CooBlock(
+            var_names=var_names,
+            lb=lb,
+            ub=ub,
+            types=types,
+            ctr_names=ctr_names,
+            senses=senses,
+            rhs=rhs,
+            rows=rows,
+            cols=cols,
+            vals=vals,
+            link_t=t_arr,
+            link_cols=netload_idx,
+            link_vals=np.ones(T),
+            var_groups={'netLoad': netload_idx},
+            children=[(d, b, T + offset) for d, b, offset in dev.children]
+        )
+
+    def finalize(
+        self,
+        m,
+        ctr2idx=None,
+        time_window=[],
+        r_label='',
+        link_rows=None
+    ):
+        """
+        Write the right-hand side of the household's net load linking
+            constraints, i.e., minus the sum of its fixed loads.
+
+        The right-hand side is computed from the household's devices, see
+            `Device.link_rhs`. This takes a single call, e.g., after fixed
+            loads were modified, without rebuilding the model.
+
+        Args:
+            m: CPLEX instance that contains the household's model
+            ctr2idx: constraint name-to-index dictionnary, used to look up the
+                linking constraints if `link_rows` is not given
+            time_window, r_label: see `Device.update_model`
+            link_rows: index of the household's net load linking constraint,
+                for each time index, e.g. range(T) in `household_model`
+
+        Returns:
+            nothing, but `m` is modified in-place
+
+        Raises:
+            ValueError: if neither `link_rows` nor `ctr2idx` is given
+        """
+        if link_rows is None:
+            link_rows = _netload_rows(
+                ctr2idx, time_window, f'{r_label}{self.label}_'
             )
-            var2idx.update(dict(zip(
-                [
-                    r_label+self.label+'_u_'+str(k)+'_'+str(t)
-                    for k in range(self.n_cycles)
-                    for t in range(
-                        self.t_start_min[k],
-                        self.t_start_max[k]+1
-                    )
-                ],
-                v_idx
-            )))
 
-        # II.
-        # Add constraints.
+        rhs = np.zeros(len(time_window))
+        for d in self.devices:
+            d_rhs = d.link_rhs(time_window)
+            if d_rhs is not None:
+                rhs += d_rhs
 
-        # exactly one start_up for each cycle
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_start_up_'+str(k)
-                for k in range(self.n_cycles)
-            ],
-            senses=['E' for k in range(self.n_cycles)],
-            rhs=[1 for k in range(self.n_cycles)],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_u_'+str(k)+'_'+str(t)]
-                        for t in range(
-                            self.t_start_min[k],
-                            self.t_start_max[k]+1
-                        )
-                    ],
-                    val=[
-                        1
-                        for t in range(
-                            self.t_start_min[k],
-                            self.t_start_max[k]+1
-                        )
-                    ]
-                )
-                for k in range(self.n_cycles)
-            ]
+        m.linear_constraints.set_rhs(
+            list(zip(np.asarray(link_rows).tolist(), rhs.tolist()))
         )
-        ctr2idx.update(dict(zip(
-            [
-                r_label+self.label+'_start_up_'+str(k)
-                for k in range(self.n_cycles)
-            ],
-            c_idx
-        )))
 
-        # net power
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_net_power_'+str(t)
-                for t in time_window
-            ],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[var2idx[r_label+self.label+'_pwr_'+str(t)]] + [
-                        var2idx[r_label+self.label+'_u_'+str(k)+'_'+str(t-d)]
-                        for k, c in enumerate(self.cycles)
-                        for d in range(self.durations[k])
-                        if (
-                            (t-d >= self.t_start_min[k])
-                            and (t-d <= self.t_start_max[k])
-                        )
-
-                    ],
-                    val=[1] + [
-                        - c[d]
-                        for k, c in enumerate(self.cycles)
-                        for d in range(self.durations[k])
-                        if (
-                            (t-d >= self.t_start_min[k])
-                            and (t-d <= self.t_start_max[k])
-                        )
-                    ]
-                )
-                for t in time_window
-            ]
-        )
-        ctr2idx.update(dict(zip(
-            [
-                r_label+self.label+'_net_power_'+str(t)
-                for t in time_window
-            ],
-            c_idx
-        )))
+        return
 
-        # cycle k+1 cannot start before end of cycle k
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_cycle_start_'+str(k)
-                for k in range(1, self.n_cycles)
-            ],
-            senses=[
-                'G'
-                for k in range(1, self.n_cycles)
-            ],
-            rhs=[
-                self.durations[k-1]
-                for k in range(1, self.n_cycles)
-            ],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_u_'+str(k-1)+'_'+str(t)]
-                        for t in range(
-                            self.t_start_min[k-1],
-                            self.t_start_max[k-1]+1
-                        )
-                    ] + [
-                        var2idx[r_label+self.label+'_u_'+str(k)+'_'+str(t)]
-                        for t in range(
-                            self.t_start_min[k],
-                            self.t_start_max[k]+1
-                        )
-                    ],
-                    val=[
-                        - t
-                        for t in range(
-                            self.t_start_min[k-1],
-                            self.t_start_max[k-1]+1
-                        )
-                    ] + [
-                        t
-                        for t in range(
-                            self.t_start_min[k],
-                            self.t_start_max[k]+1
-                        )
-                    ]
-                )
-                for k in range(1, self.n_cycles)
-            ]
+
+def assemble_household(
+    m,
+    devices,
+    var2idx=None,
+    ctr2idx=None,
+    time_window=[],
+    delta_t=1,
+    r_label='',
+    binaries=True,
+    link_rows=None
+):
+    """
+    Add all devices of a household to the model.
+
+    The devices' COO blocks are concatenated, then added to `m` with a single
+        call for variables and a single call for constraints.
+    Since households are the devices of the aggregator, this also adds all
+        households to the aggregator's model at once.
+
+    Args:
+        m: existing CPLEX instance, which contains the household's net load
+            linking constraints
+        devices: list of that household's devices
+        var2idx, ctr2idx, time_window, delta_t, r_label, binaries, link_rows:
+            see `Device.update_model`
+
+    Returns:
+        v_idx: range of the indices of the devices' variables in `m`
+            `m`, `var2idx` and `ctr2idx` are modified in-place
+
+    Raises:
+        ValueError: if `link_rows` is not given, and either `ctr2idx` is not
+            given or devices have different `link_name`
+    """
+    blocks = [
+        d.to_coo(
+            time_window=time_window,
+            delta_t=delta_t,
+            r_label=r_label,
+            binaries=binaries
         )
-        ctr2idx.update(dict(zip(
-            [
-                r_label+self.label+'_cycle_start_'+str(k)
-                for k in range(1, self.n_cycles)
-            ],
-            c_idx
-        )))
+        for d in devices
+    ]
+    if link_rows is None:
+        link_names = {d.link_name for d in devices} or {Device.link_name}
+        if len(link_names) > 1:
+            raise ValueError(
+                'devices are added to different linking constraints: '
+                'pass link_rows'
+            )
+        link_rows = _netload_rows(
+            ctr2idx, time_window, r_label, link_names.pop()
+        )
+    blk = _stack_blocks(blocks, devices)
+    v_base = _load_block(m, blk, var2idx, ctr2idx, link_rows)
 
-        # Done.
+    for d, child, offset in blk.children:
+        d.set_var_idx(child, v_base + offset)
 
-        return
+    return range(v_base, v_base + len(blk.var_names))
 
 
-class CurtailableLoad(Device):
+def assemble_lp_sparse(
+    devices,
+    time_window=[],
+    delta_t=1,
+    r_label='',
+    binaries=True
+):
     """
-    Curtailable Load.
+    Build a model with several devices, from a single sparse matrix.
+
+    The blocks of all devices are stacked, then handed to CPLEX with one call
+        for all variables and one call for all constraints, as in
+        `assemble_household`.
+    Devices are not linked to each other, and their linking coefficients are
+        ignored: pass households to obtain complete household models.
 
+    Args:
+        devices: list of Device
+        time_window, delta_t, r_label, binaries: see `Device.update_model`
+
+    Returns:
+        m: CPLEX instance
     """
+    blocks = [
+        d.to_coo(
+            time_window=time_window,
+            delta_t=delta_t,
+            r_label=r_label,
+            binaries=binaries
+        )
+        for d in devices
+    ]
 
-    def __init__(
-        self,
-        label='',
-        load=[],
-        binary=True
-    ):
-        """
-        Class constructor.
+    m = cplex.Cplex()
+    if len(blocks) == 0:
+        return m
 
-        """
+    blk = _stack_blocks(blocks, devices)
+    # no linking rows: the block is not linked
+    v_base = _load_block(m, blk, None, None, [])
 
-        Device.__init__(self, label=label)
+    for d, child, offset in blk.children:
+        d.set_var_idx(child, v_base + offset)
 
-        #
-        self.load = load
-        self.binary = binary
+    return m
 
-    def update_model(
-        self,
+
+def household_model(
+    hh,
+    time_window=[],
+    delta_t=1,
+    binaries=True,
+    templates=None
+):
+    """
+    Build the standalone model of a household.
+
+    Such models are, e.g., the subproblems of a decentralized method. The
+        household's net load variables are not linked to any constraint.
+    If `templates` is given, households with the same template signature share
+        the structure of their model: the first model is built from scratch
+        and stored in `templates`, and the following ones are copies of it,
+        whose names, bounds, right-hand sides and coefficients are updated
+        in-place.
+
+    Args:
+        hh: the Household
+        time_window: a list of the time indices [0, ..., T-1]
+        delta_t: duration of each time-step, in hours
+        binaries: boolean that indicates whether binary requirements are to be
+            enforced or not.
+        templates: dictionnary that maps template signatures to template
+            CPLEX models, updated in-place
+
+    Returns:
+        m: the household's CPLEX model
+        var2idx: variable name-to-index dictionnary
+        ctr2idx: constraint name-to-index dictionnary
+    """
+    var2idx = {}
+    ctr2idx = {}
+
+    sig = hh.template_signature(time_window=time_window, binaries=binaries)
+    if templates is not None and sig in templates:
+        # copy the template, then overwrite its numerical data
+        m = cplex.Cplex(templates[sig])
+        hh.update_in_place(
+            m,
+            var2idx=var2idx,
+            ctr2idx=ctr2idx,
+            time_window=time_window,
+            delta_t=delta_t,
+            binaries=binaries,
+            link_rows=[]
+        )
+        return m, var2idx, ctr2idx
+
+    m = cplex.Cplex()
+    hh.update_model(
         m,
-        var2idx={},
-        ctr2idx={},
-        time_window={},
-        delta_t=1,
-        r_label='',
-        binaries=True
-    ):
-        """
-        Add self to household model.
+        var2idx=var2idx,
+        ctr2idx=ctr2idx,
+        time_window=time_window,
+        delta_t=delta_t,
+        binaries=binaries,
+        link_rows=[]
+    )
+    if templates is not None:
+        # keep a copy, so that the returned model can be modified freely
+        templates[sig] = cplex.Cplex(m)
 
-        """
+    return m, var2idx, ctr2idx
 
-        # I.
-        # Add variables.
-        # Load can be negative (ie generation), so a lower bound is specified
-        v_idx = m.variables.add(
-            names=[r_label+self.label+'_pwr_'+str(t) for t in time_window],
-            lb=[-cplex.infinity for t in time_window],
-            columns=[
-                cplex.SparsePair(
-                    ind=[ctr2idx[r_label+'link_netLoad_'+str(t)]],
-                    val=[1]
-                )
-                for t in time_window
-            ]
-        )
-        var2idx.update(dict(zip(
-            [r_label+self.label+'_pwr_'+str(t) for t in time_window],
-            v_idx
-        )))
 
-        # on-off
-        if self.binary and binaries:
-            # binary control
-            v_idx = m.variables.add(
-                names=[r_label+self.label+'_u_'+str(t) for t in time_window],
-                types=['B' for t in time_window]
-            )
-            var2idx.update(dict(zip(
-                [r_label+self.label+'_u_'+str(t) for t in time_window],
-                v_idx
-            )))
-        else:
-            # continuous control
-            v_idx = m.variables.add(
-                names=[r_label+self.label+'_u_'+str(t) for t in time_window],
-                lb=[0 for t in time_window],
-                ub=[1 for t in time_window]
+# Groups of variables, in the order of their kind in packed keys
+VAR_KINDS = (
+    'netLoad', 'pwr', 'pwr_chg', 'pwr_dis', 'soc', 'chg_ind', 'dis_ind',
+    'temp', 'on_ind', 'u'
+)
+
+
+def pack_key(hh_id, dev_id, kind, t):
+    """
+    Pack the identity of a variable into a single 64-bit integer key.
+
+    Each field is stored on 16 bits. Arguments can be ints or int arrays.
+
+    Args:
+        hh_id: index of the household
+        dev_id: index of the device in the household, starting at 1; 0
+            refers to the household itself
+        kind: index of the variable's group in `VAR_KINDS`
+        t: position of the variable in its group, i.e. its time index for all
+            groups but the start-up variables of shiftable loads
+
+    Returns:
+        key: (hh_id << 48) | (dev_id << 32) | (kind << 16) | t
+
+    Raises:
+        ValueError: if a field is negative or does not fit on 16 bits, which
+            would otherwise yield colliding keys
+    """
+    for name, f in (('hh_id', hh_id), ('dev_id', dev_id), ('kind', kind),
+                    ('t', t)):
+        f = np.asarray(f)
+        if f.size > 0 and (f.min() < 0 or f.max() >= 2**16):
+            raise ValueError(
+                f'{name} must be in [0, 2**16), got values in '
+                f'[{f.min()}, {f.max()}]'
             )
-            var2idx.update(dict(zip(
-                [r_label+self.label+'_u_'+str(t) for t in time_window],
-                v_idx
-            )))
 
-        # II.
-        # Add constraints
+    return (
+        (np.uint64(hh_id) << np.uint64(48))
+        | (np.uint64(dev_id) << np.uint64(32))
+        | (np.uint64(kind) << np.uint64(16))
+        | np.uint64(t)
+    )
 
-        # curtailment constraint
-        c_idx = m.linear_constraints.add(
-            names=[
-                r_label+self.label+'_curtail_'+str(t)
-                for t in time_window
-            ],
-            senses=['E' for t in time_window],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[
-                        var2idx[r_label+self.label+'_pwr_'+str(t)],
-                        var2idx[r_label+self.label+'_u_'+str(t)]
-                    ],
-                    val=[
-                        1,
-                        -1 * self.load[t]
-                    ]
-                )
-                for t in time_window
-            ]
+
+def key_index(households):
+    """
+    Map the packed key of each variable to its index in the model.
+
+    Keys are built from the households' and devices' `var_idx`, thus no
+        variable name is formed or hashed.
+
+    Args:
+        households: list of Household, already added to a model, e.g. as
+            filled by `generator.build_model`
+
+    Returns:
+        index: dictionnary that maps packed keys (int) to variable indices
+    """
+    keys = []
+    cols = []
+    for hh_id, hh in enumerate(households):
+        for dev_id, d in enumerate([hh] + list(hh.devices)):
+            for group, idx in d.var_idx.items():
+                idx = np.asarray(idx, dtype=np.int64)
+                keys.append(pack_key(
+                    hh_id, dev_id, VAR_KINDS.index(group),
+                    np.arange(idx.size, dtype=np.uint64)
+                ))
+                cols.append(idx)
+    if len(keys) == 0:
+        return {}
+
+    return dict(zip(
+        np.concatenate(keys).tolist(),
+        np.concatenate(cols).tolist()
+    ))
+
+
+def name_of(key, m, index):
+    """
+    Name of the variable with packed key `key`, e.g. for LP-file output.
+
+    Args:
+        key: packed key of the variable
+        m: CPLEX instance that contains the variable
+        index: key-to-index dictionnary, see `key_index`
+
+    Returns:
+        name: the variable's name in `m`
+    """
+    return m.variables.get_names(index[int(key)])
+
+
+@njit(cache=True)
+def _make_native(hh_scale, load_norm, eps):
+    """
+    Native load of each household, i.e. its scaled and noisy normalized load.
+
+    Args:
+        hh_scale: scaling factor of each household, shape (n_hh,)
+        load_norm: normalized load, shape (T,)
+        eps: white noise, shape (n_hh, T)
+
+    Returns:
+        native load of each household, clipped at zero, shape (n_hh, T)
+    """
+    return np.maximum(0., hh_scale[:, None]*(load_norm[None, :] + 0.05*eps))
+
+
+@njit(cache=True)
+def _fill_ev_window(T, lo, hi):
+    """
+    Minimum and maximum charging power of an electric vehicle.
+
+    Charging is only possible from the 14th hour of each day on, i.e.,
+        from 7pm if the time horizon starts at 5am.
+
+    Args:
+        T: number of (hourly) time steps
+        lo: minimum charging power, when charging is possible
+        hi: maximum charging power, when charging is possible
+
+    Returns:
+        out_min, out_max: minimum and maximum power, shape (T,)
+    """
+    out_min = np.zeros(T)
+    out_max = np.zeros(T)
+    if T % 24 == 0:
+        # full days: the charging window is the same slice of each day
+        out_min.reshape(T // 24, 24)[:, 14:] = lo
+        out_max.reshape(T // 24, 24)[:, 14:] = hi
+    else:
+        mask = (np.arange(T) % 24) >= 14
+        out_min[mask] = lo
+        out_max[mask] = hi
+    return out_min, out_max
+
+
+def _cycle_profile(d_param, kind, length):
+    """
+    Load profile of a cycle of a shiftable appliance.
+
+    Args:
+        d_param: dictionnary of device parameters
+        kind: appliance, e.g. 'dw' for dishwashers
+        length: duration of a cycle, if d_param does not give it
+
+    Returns:
+        d_param['<kind>_cycle'] if present; otherwise, a unit load during
+            d_param['<kind>_cycle_length'] time steps, or `length` if that
+            key is missing too
+    """
+    if kind+'_cycle' in d_param:
+        return np.array(d_param[kind+'_cycle'], dtype=np.float64)
+    return np.ones(d_param.get(kind+'_cycle_length', length))
+
+
+def _shiftable_loads(label, cycle, n_day, per_day=False):
+    """
+    Shiftable loads of an appliance that runs one cycle per day.
+
+    Each cycle must start and end within its day. Start-up windows are
+        tuples, built for each device, so devices never share mutable state.
+
+    Args:
+        label: label of the appliance, e.g. 'shift_dw_0'
+        cycle: load profile of a cycle
+        n_day: number of (full) days in the time horizon
+        per_day: if True, one single-cycle device is created per day, with
+            label '<label>_<day>', as in earlier versions. Otherwise, a single
+            device with one cycle per day is created. Both have the same
+            feasible schedules, but the latter has fewer variables and
+            constraints, since its power variables are shared by all days.
+
+    Returns:
+        a list of ShiftableLoad
+    """
+    t_start_min = tuple(24*day for day in range(n_day))
+    t_start_max = tuple(24*(day+1)-1-len(cycle) for day in range(n_day))
+    if per_day:
+        return [
+            ShiftableLoad(
+                label=label+'_'+str(day),
+                t_start_min=t_start_min[day:day+1],
+                t_start_max=t_start_max[day:day+1],
+                cycles=[cycle]
+            )
+            for day in range(n_day)
+        ]
+    return [
+        ShiftableLoad(
+            label=label,
+            t_start_min=t_start_min,
+            t_start_max=t_start_max,
+            cycles=[cycle] * n_day
         )
-        ctr2idx.update(dict(zip(
-            [self.label+'_curtail_'+str(t) for t in time_window],
-            c_idx
-        )))
+    ]
+
+
+def _legacy_draws(n_hh, T, own_rates, seed=None):
+    """
+    Draw the random numbers of all households, as in the original generator.
+
+    Each household has its own `RandomState`, seeded from a master stream,
+        and draws numbers in the order in which its devices are generated.
+        Numbers are only drawn for the devices it owns. This reproduces
+        the instances generated with earlier versions, e.g., the testbed of
+        [Anjos, Lodi, Tanneau]. The global numpy random state is not modified
+        when `seed` is given.
+
+    Args:
+        n_hh: number of households
+        T: length of the time horizon
+        own_rates: ownership rates of devices
+        seed: seed of the master stream; if None, the global numpy random
+            state is used instead
+
+    Returns:
+        hh_scale: scaling factor of each household, shape (n_hh,)
+        own_draws: ownership tests, shape (n_hh, 5), see `generate_devices`
+        eps_load, eps_pv, eps_temp: noise of native loads, PV production and
+            outside temperature, shape (n_hh, T)
+    """
+    rs = np.random if seed is None else np.random.RandomState(seed)
+    hh_seeds = rs.randint(low=0, high=2**16, size=n_hh)
+
+    hh_scale = np.empty(n_hh)
+    # tests that are not drawn are set to fail
+    own_draws = np.ones((n_hh, 5))
+    eps_load = np.empty((n_hh, T))
+    eps_pv = np.zeros((n_hh, T))
+    eps_temp = np.zeros((n_hh, T))
+
+    for i_hh in range(n_hh):
+        r = np.random.RandomState(hh_seeds[i_hh])
+        hh_scale[i_hh] = r.uniform(low=0.5, high=1.5)
+        own_draws[i_hh, 0] = r.rand()  # PV
+        eps_load[i_hh] = r.randn(T)
+        if own_draws[i_hh, 0] < own_rates['pv']:
+            eps_pv[i_hh] = r.rand(T)
+        own_draws[i_hh, 1] = r.rand()  # dishwasher
+        own_draws[i_hh, 2] = r.rand()  # clothes washer
+        if own_draws[i_hh, 2] < own_rates['clothes_washer']:
+            own_draws[i_hh, 3] = r.rand()  # clothes dryer
+        own_draws[i_hh, 4] = r.rand()  # heating
+        if own_draws[i_hh, 4] < own_rates['heating']:
+            eps_temp[i_hh] = r.randn(T)
+
+    return hh_scale, own_draws, eps_load, eps_pv, eps_temp
 
 
 def generate_devices(
@@ -1360,7 +2419,9 @@ def generate_devices(
     temperature,
     own_rates,
     d_param=None,
-    seed=None
+    seed=None,
+    legacy_rng=False,
+    per_day_shiftable=False
 ):
     """
     Generate a set of devices for each household.
@@ -1384,12 +2445,25 @@ def generate_devices(
     temperature : float array
         Outside temperature for each house.
     own_rates : dictionnary of ownership rates for devices.
+    d_param : dictionnary of device parameters, optional
+        The load profile of a cycle of dishwashers, clothes washers and
+        clothes dryers is given by 'dw_cycle', 'cw_cycle' and 'cd_cycle'. If
+        a profile is missing, the load is 1 during '<kind>_cycle_length'
+        time steps (2, 2 and 3 if missing too).
+    seed : integer, optional
+        Seed of the random number generator
+    legacy_rng : bool, optional
+        If True, random numbers are drawn as in earlier versions of this
+        generator, which reproduces their instances for a given seed (see
+        `_legacy_draws`). Otherwise, a `numpy.random.Generator` is used: it
+        is faster, but the same seed yields different instances.
+    per_day_shiftable : bool, optional
+        If True, shiftable loads (dishwasher, clothes washer and dryer) are
+        modeled with one single-cycle device per day, as in earlier versions.
+        Otherwise, each appliance is one device with one cycle per day: the
+        optimal value is the same, with fewer variables and constraints.
 
     """
-    # set random seed
-    if seed is not None:
-        np.random.seed(seed)
-
     # list of devices
     # devices[h] is the set of devices for household h
     devices = []
@@ -1431,86 +2505,88 @@ def generate_devices(
     #####################################
     #   I. Households parameters
     #####################################
-    hh_seeds = np.random.randint(
-        low=0,
-        high=2**16,
-        size=n_hh
+    if legacy_rng:
+        hh_scale, own_draws, eps_load, eps_pv, eps_temp = _legacy_draws(
+            n_hh, T, own_rates, seed
+        )
+    else:
+        # Random numbers are drawn for all households at once, whether or not
+        # they are used
+        rng = np.random.default_rng(seed)
+        # Household scaling factor, between 0.5 and 1.5
+        hh_scale = rng.uniform(low=0.5, high=1.5, size=n_hh)
+        # Ownership tests, in that order: PV, dishwasher, clothes washer,
+        # clothes dryer, heating
+        own_draws = rng.random((n_hh, 5))
+        eps_load = rng.standard_normal((n_hh, T))  # white noise
+        eps_pv = rng.random((n_hh, T))
+        eps_temp = rng.standard_normal((n_hh, T))
+    # Native loads
+    # All uncontrollable loads are aggregated into one 'native' load
+    native_load = _make_native(
+        hh_scale,
+        np.ascontiguousarray(load_norm, dtype=np.float64),
+        eps_load
     )
+    # PV production
+    pv_prod = hh_scale[:, None] * np.asarray(pv_norm)[None, :] * eps_pv
+    # Outside temperature, seen by each thermostat
+    temp_ext = np.asarray(temperature)[None, :] + 0.5*eps_temp
+
+    # Parameters that are identical for all devices of a kind are built once
+    # and shared, as read-only arrays
+    # Load profile of each shiftable load's cycle
+    dw_cycle = _cycle_profile(d_param, 'dw', 2)
+    cw_cycle = _cycle_profile(d_param, 'cw', 2)
+    cd_cycle = _cycle_profile(d_param, 'cd', 3)
+    # Temperature bounds of thermal loads
+    heat_temp_min = np.full(T, d_param['heat_temp_min'], dtype=np.float64)
+    heat_temp_max = np.full(T, d_param['heat_temp_max'], dtype=np.float64)
+    for a in (dw_cycle, cw_cycle, cd_cycle, heat_temp_min, heat_temp_max):
+        a.setflags(write=False)
 
     for i_hh in range(n_hh):
 
-        # set numpy random seed
-        np.random.seed(hh_seeds[i_hh])
-
-        # Household sclaing factor
-        # between 0.5 and 1.5
-        hh_scale = np.random.uniform(
-            low=0.5,
-            high=1.5
-        )
-
         # list of that household's devices
         dev = []
 
         #####################################
         #   II. Generate devices
         #####################################
-        renew = (np.random.rand() < own_rates['pv'])
+        renew = (own_draws[i_hh, 0] < own_rates['pv'])
 
         # II.1 - Native loads
-        # All uncontrollable loads are aggregated into one 'native' load
-        eps = np.random.randn(T)  # white noise
-        native_load = np.maximum(
-            0,
-            hh_scale*(load_norm + 0.05*eps)
-        )
         d = FixedLoad(
             label='load_'+str(i_hh),
-            fixed_load=native_load
+            fixed_load=native_load[i_hh]
         )
         dev.append(d)
 
         # II.2 - Curtailable loads
         # Curtailable PV generation
         if renew:
-            eps = np.random.rand(T)
-            pv_prod = hh_scale * pv_norm * eps
-
             d = CurtailableLoad(
                 label='PV_'+str(i_hh),
-                load=-pv_prod,
+                load=-pv_prod[i_hh],
                 binary=True
             )
             dev.append(d)
 
         # II.3 - Uninterruptible loads
-        # One cycle per day
+        # One cycle per day, see `_shiftable_loads`
         # Dishwasher
-        if np.random.rand() < own_rates['dishwasher']:
-            cycle_length = 2
-            cycle = np.ones(cycle_length)
-            for day in range(n_day):
-                d = ShiftableLoad(
-                    label='shift_dw_'+str(i_hh)+'_'+str(day),
-                    t_start_min=[0+24*day],
-                    t_start_max=[0+24*(day+1)-1-cycle_length],
-                    cycles=[cycle]
-                )
-                dev.append(d)
+        if n_day > 0 and own_draws[i_hh, 1] < own_rates['dishwasher']:
+            dev.extend(_shiftable_loads(
+                'shift_dw_'+str(i_hh), dw_cycle, n_day, per_day_shiftable
+            ))
         # Clothes washer
         clothes_washer = False
-        if np.random.rand() < own_rates['clothes_washer']:
+        if own_draws[i_hh, 2] < own_rates['clothes_washer']:
             clothes_washer = True
-            cycle_length = 2
-            cycle = np.ones(cycle_length)
-            for day in range(n_day):
-                d = ShiftableLoad(
-                    label='shift_cw_'+str(i_hh)+'_'+str(day),
-                    t_start_min=[0+24*day],
-                    t_start_max=[0+24*(day+1)-1-cycle_length],
-                    cycles=[cycle]
-                )
-                dev.append(d)
+        if n_day > 0 and clothes_washer:
+            dev.extend(_shiftable_loads(
+                'shift_cw_'+str(i_hh), cw_cycle, n_day, per_day_shiftable
+            ))
         # Clothes dryer
         # only households with clothes washer have a clothes dryer
         if own_rates['clothes_washer'] > 0:
@@ -1518,19 +2594,13 @@ def generate_devices(
         else:
             p_cd = 0
         if (
-            clothes_washer
-            and np.random.rand() < p_cd
+            n_day > 0
+            and clothes_washer
+            and own_draws[i_hh, 3] < p_cd
         ):
-            cycle_length = 3
-            cycle = np.ones(cycle_length)
-            for day in range(n_day):
-                d = ShiftableLoad(
-                    label='shift_cd_'+str(i_hh)+'_'+str(day),
-                    t_start_min=[0+24*day],
-                    t_start_max=[0+24*(day+1)-1-cycle_length],
-                    cycles=[cycle]
-                )
-                dev.append(d)
+            dev.extend(_shiftable_loads(
+                'shift_cd_'+str(i_hh), cd_cycle, n_day, per_day_shiftable
+            ))
 
         # II.4 - Deferrrable loads
         # Electric vehicle
@@ -1541,23 +2611,12 @@ def generate_devices(
             # minimum charging power is set at ~40% of max charging power
             # enery requirements are 10kW.h for each day
             # charging hours are 8pm-5am
-            ev_pwr_min = np.zeros(T)
-            ev_pwr_max = np.zeros(T)
             # here we assume that the time horizon starts at 5am
-            ev_pwr_min[
-                [
-                    t
-                    for t in time_window
-                    if ((t % 24 < 24) and (t % 24 >= 14))
-                ]
-            ] = d_param['ev_pwr_min']
-            ev_pwr_max[
-                [
-                    t
-                    for t in time_window
-                    if ((t % 24 < 24) and (t % 24 >= 14))
-                ]
-            ] = d_param['ev_pwr_max']
+            ev_pwr_min, ev_pwr_max = _fill_ev_window(
+                T,
+                float(d_param['ev_pwr_min']),
+                float(d_param['ev_pwr_max'])
+            )
 
             d = DeferrableLoad(
                 label='EV_'+str(i_hh),
@@ -1570,14 +2629,12 @@ def generate_devices(
 
         # II.5 - Thermal loads
         # Thermostat
-        if np.random.rand() < own_rates['heating']:
-
-            eps = np.random.randn(T)
+        if own_draws[i_hh, 4] < own_rates['heating']:
             d = ThermalLoad(
                 label='heat_'+str(i_hh),
-                temp_min=d_param['heat_temp_min']*np.ones(T),
-                temp_max=d_param['heat_temp_max']*np.ones(T),
-                temp_ext=temperature+0.5*eps,
+                temp_min=heat_temp_min,
+                temp_max=heat_temp_max,
+                temp_ext=temp_ext[i_hh],
                 temp_init=d_param['heat_temp_init'],
                 pwr_th_min=d_param['heat_pwr_min'],
                 pwr_th_max=d_param['heat_pwr_max'],
@@ -1610,5 +2667,40 @@ def generate_devices(
     return devices
 
 
+def _prewarm():
+    """
+    Compile the numba kernels ahead of their first use.
+
+    Each kernel is called once on dummy data with T=2, using the same
+        argument types as in the model-building and instance-generation code.
+        With `cache=True`, this loads the compiled code from disk when it is
+        available.
+    """
+    T = 2
+    nnz = 3 + 4*(T-1) + 10*T
+    try:
+        _battery_coo(
+            T,
+            0, T, 2*T, 3*T, 4*T,
+            0,
+            1., 1., 1., 1.,
+            0., 1., 0., 1.,
+            np.empty(nnz, dtype=np.int64),
+            np.empty(nnz, dtype=np.int64),
+            np.empty(nnz, dtype=np.float64)
+        )
+        _make_native(np.ones(1), np.ones(T), np.zeros((1, T)))
+        _fill_ev_window(T, 1., 1.)
+    except Exception:
+        # warm-up is only an optimization: kernels compile on first use anyway
+        pass
+    return
+
+
+# Set DER_PREWARM=1 to compile numba kernels when this module is imported
+if os.environ.get('DER_PREWARM') == '1':
+    _prewarm()
+
+
 if __name__ == '__main__':
     0
@@ -16,8 +16,11 @@ For detailed models, see [Anjos, Lodi and Tanneau, A Decentralized Framework
 Contact info: mathieu.tanneau@polymtl.ca
 """
 
+import functools
+
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 
 import cplex
 
@@ -28,6 +31,57 @@ def main():
     0
 
 
+@functools.lru_cache(maxsize=None)
+def _read_columns(path, columns, dtype=None):
+    """
+    Read columns of a CSV file.
+
+    Only the requested columns are parsed. Results are cached, since data
+        files are static inputs: arrays are read-only, as they are shared by
+        all callers.
+
+    Args:
+        path: path to the CSV file
+        columns: tuple of column names
+        dtype: type of the columns; if None, it is inferred by pandas
+
+    Returns:
+        a tuple of arrays, one per column
+    """
+    df = pd.read_csv(path, usecols=list(columns), dtype=dtype)
+    arrays = tuple(df[c].to_numpy() for c in columns)
+    for a in arrays:
+        a.setflags(write=False)
+    return arrays
+
+
+@functools.lru_cache(maxsize=None)
+def _read_normalized(path, columns):
+    """
+    Read columns of a CSV file, each divided by its mean.
+
+    Same as `_read_columns`, including caching. Columns are read as float64.
+    """
+    arrays = tuple(
+        a / np.mean(a)
+        for a in _read_columns(path, columns, dtype=np.float64)
+    )
+    for a in arrays:
+        a.setflags(write=False)
+    return arrays
+
+
+def _window(a, time_window):
+    """
+    Select the entries of `a` in the time window.
+
+    The result is a new, writable array: cached arrays are never exposed.
+    """
+    if isinstance(time_window, range) and time_window.step == 1:
+        return a[time_window.start:time_window.stop].copy()
+    return a[np.asarray(time_window)]
+
+
 def load_data(
     time_window
 ):
@@ -47,30 +101,32 @@ def load_data(
         pv_norm: normalized PV output
         temp: temperature
         wind_norm: normalized wind output
+        All are new arrays, which callers may modify in-place.
     """
+    # Data files are parsed once, then served from cache
     # Price data (normalized)
-    ont_price = pd.read_csv('../data/price2016.csv')
-    price_mkt = np.array(ont_price['HOEP'])[time_window]  # market prices
-    price_tou = np.array(ont_price['TOU'])[time_window]  # Time-of-Use prices
+    price_mkt, price_tou = _read_columns(
+        '../data/price2016.csv', ('HOEP', 'TOU')
+    )
+    price_mkt = _window(price_mkt, time_window)  # market prices
+    price_tou = _window(price_tou, time_window)  # Time-of-Use prices
 
     # Production data (normalized)
-    ont_output = pd.read_csv('../data/prod2016.csv')
-    wind_norm = np.array(
-        (ont_output['WIND']/np.mean(ont_output['WIND']))
-    )[time_window]
-    pv_norm = np.array(
-        (ont_output['SOLAR']/np.mean(ont_output['SOLAR']))
-    )[time_window]
+    wind_norm, pv_norm = _read_normalized(
+        '../data/prod2016.csv', ('WIND', 'SOLAR')
+    )
+    wind_norm = _window(wind_norm, time_window)
+    pv_norm = _window(pv_norm, time_window)
 
     # Load data
-    ont_load = pd.read_csv('../data/load2016.csv')
-    load_norm = np.array(
-        ont_load['OntDemand']/np.mean(ont_load['OntDemand'])
-    )[time_window]
+    load_norm, = _read_normalized('../data/load2016.csv', ('OntDemand',))
+    load_norm = _window(load_norm, time_window)
 
     # Temperature data
-    temperature = pd.read_csv('../data/temperature2016.csv')
-    temperature = np.array(temperature['Temperature'])[time_window]
+    temperature, = _read_columns(
+        '../data/temperature2016.csv', ('Temperature',)
+    )
+    temperature = _window(temperature, time_window)
 
     return load_norm, price_mkt, price_tou, pv_norm, wind_norm, temperature
 
@@ -81,7 +137,10 @@ def generate_instance(
     t_horizon,
     own_rates,
     delta_t=1,
-    seed=0
+    seed=0,
+    legacy_rng=False,
+    per_day_shiftable=False,
+    households=None
 ):
     """
     Generate an instance.
@@ -92,6 +151,12 @@ def generate_instance(
         t_horizon: length of the time horizon
         own_rates: ownership rates of the considered devices
         seed: random seed
+        legacy_rng: if True, draw random numbers as earlier versions did, to
+            reproduce their instances (see `devices.generate_devices`)
+        per_day_shiftable: if True, model shiftable loads with one device per
+            day, as earlier versions did (see `devices.generate_devices`)
+        households: if a list is given, the Household objects of the model
+            are appended to it, see `build_model`
 
     Returns:
         m: CPLEX instance (MIP)
@@ -114,7 +179,9 @@ def generate_instance(
         pv_norm=pv_norm,
         temperature=temperature,
         own_rates=own_rates,
-        seed=seed
+        seed=seed,
+        legacy_rng=legacy_rng,
+        per_day_shiftable=per_day_shiftable
     )
 
     # minimum and maximum aggregated load
@@ -128,7 +195,8 @@ def generate_instance(
         delta_t,
         price_mkt,
         total_load_min,
-        total_load_max
+        total_load_max,
+        households=households
     )
 
     return m
@@ -140,7 +208,8 @@ def build_model(
     delta_t=1,
     price_mkt=[],
     total_load_min=[],
-    total_load_max=[]
+    total_load_max=[],
+    households=None
 ):
     """
     Build CPLEX model.
@@ -152,6 +221,9 @@ def build_model(
         price_mkt: market price of electricity
         total_load_min: minimum total load for each time step
         total_load_max: maximum total load for each time step
+        households: if a list is given, the Household objects of the model
+            are appended to it, e.g. to locate their variables through
+            `var_idx` or `devices.key_index`
 
     Returns:
         m: a centralized MILP formulation of the DR problem
@@ -160,8 +232,8 @@ def build_model(
     """
     m = cplex.Cplex()
 
-    v2idx = {}
-    c2idx = {}
+    # Variables and constraints are located through the index ranges returned
+    # by CPLEX: no name-to-index map is needed
 
     # I.
     # Create linking variables
@@ -169,81 +241,47 @@ def build_model(
     # total load
     totalLoad_obj = delta_t*price_mkt
     v_idx = m.variables.add(
-        names=['totalLoad_'+str(t) for t in time_window],
+        names=[f'totalLoad_{t}' for t in time_window],
         obj=totalLoad_obj,
         lb=total_load_min,
         ub=total_load_max
     )
-    v2idx.update(dict(zip(
-        ['totalLoad'+str(t) for t in time_window],
-        v_idx
-    )))
 
     # II.
     # Create linking constraints
-    c_idx = m.linear_constraints.add(
-        names=['link_total_'+str(t) for t in time_window],
-        lin_expr=[
-            cplex.SparsePair(
-                ind=[v2idx['totalLoad'+str(t)]],
-                val=[-1]
-            )
-            for t in time_window
-        ]
+    # <totalLoad_t> has coefficient -1 in row t
+    T = len(v_idx)
+    c_idx = devices.add_sparse(
+        m,
+        [f'link_total_{t}' for t in time_window],
+        'E' * T,
+        np.zeros(T),
+        -sp.identity(T),
+        shift=v_idx[0] if T > 0 else 0
     )
-    c2idx.update(dict(zip(
-        ['totalLoad_link'+str(t) for t in time_window],
-        c_idx
-    )))
 
     # III.
     # Add resources to the model
-    for i_r, r_devices in enumerate(dev):
-        r_label = 'HH_'+str(i_r)
-        # create net load variable
-        v_idx = m.variables.add(
-            names=[r_label+'_'+'netLoad_'+str(t) for t in time_window],
-            columns=[
-                cplex.SparsePair(
-                    ind=[c2idx['totalLoad_link'+str(t)]],
-                    val=[1]
-                )
-                for t in time_window
-            ],
-            ub=[10 for _ in time_window]
+    # Households are the devices of the aggregator: their blocks are stacked,
+    # then all their variables (net load and devices) are loaded with one
+    # call, and all their constraints with another
+    hh_list = [
+        devices.Household(
+            label=f'HH_{i_r}',
+            devices=r_devices,
+            netload_max=10
         )
-        v2idx.update(dict(zip(
-            [r_label+'_'+'netLoad_'+str(t) for t in time_window],
-            v_idx
-        )))
-
-        # create linking net load for household
-        c_idx = m.linear_constraints.add(
-            senses=['E' for t in time_window],
-            names=[r_label+'_'+'link_netLoad_'+str(t) for t in time_window],
-            lin_expr=[
-                cplex.SparsePair(
-                    ind=[v2idx[r_label+'_'+'netLoad_'+str(t)]],
-                    val=[-1]
-                )
-                for t in time_window
-            ]
-        )
-        c2idx.update(dict(zip(
-            [r_label+'_'+'link_netLoad_'+str(t) for t in time_window],
-            c_idx
-        )))
-
-        # update with device models
-        for d in r_devices:
-            d.update_model(
-                m,
-                var2idx=v2idx,
-                ctr2idx=c2idx,
-                time_window=time_window,
-                delta_t=delta_t,
-                r_label=r_label+'_'
-            )
+        for i_r, r_devices in enumerate(dev)
+    ]
+    devices.assemble_household(
+        m,
+        hh_list,
+        time_window=time_window,
+        delta_t=delta_t,
+        link_rows=c_idx
+    )
+    if households is not None:
+        households.extend(hh_list)
 
     return m
 
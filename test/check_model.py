@@ -0,0 +1,165 @@
+"""
+Consistency checks for the model builder.
+
+Run from any directory:
+    python test/check_model.py
+
+Checks:
+    reference: a small instance, generated with `legacy_rng=True` and
+        `per_day_shiftable=True`, is written as an LP file identical to
+        `reference/instance_1hh_24h.lp`, which was written by the original
+        (name-based) model builder
+    templates: household models copied from templates are identical to
+        household models built from scratch
+    lp_sparse: `assemble_lp_sparse` builds the same model as `household_model`
+    battery_fill: the fill functions generated by `Battery.codegen`, which are
+        only used without numba, write the same coefficients as `_battery_coo`
+
+Exits with a non-zero status if a check fails.
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+# data files are located relative to the test directory
+os.chdir(HERE)
+
+import devices  # noqa: E402
+import generator  # noqa: E402
+
+# every household owns every device
+OWN_RATES = {
+    'pv': 1.,
+    'dishwasher': 1.,
+    'clothes_washer': 1.,
+    'clothes_dryer': 1.,
+    'ev': 1.,
+    'heating': 1.,
+    'battery': 1.
+}
+
+
+def lp_text(m):
+    """Write a CPLEX model in LP format, and return the file's content."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.lp')
+        m.write(path)
+        with open(path) as f:
+            return f.read()
+
+
+def households(n_hh, T, seed):
+    """Generate households, with the same devices, over T time steps."""
+    data = generator.load_data(range(408, 408+T))
+    dev = devices.generate_devices(
+        n_hh=n_hh,
+        time_window=range(T),
+        load_norm=data[0],
+        pv_norm=data[3],
+        temperature=data[5],
+        own_rates=OWN_RATES,
+        seed=seed
+    )
+    return [
+        devices.Household(label=f'HH_{i}', devices=d)
+        for i, d in enumerate(dev)
+    ]
+
+
+def check_reference():
+    """Compare a small instance with the reference LP file."""
+    m = generator.generate_instance(
+        1, 408, 24, OWN_RATES, seed=42,
+        legacy_rng=True, per_day_shiftable=True
+    )
+    with open(os.path.join(HERE, 'reference', 'instance_1hh_24h.lp')) as f:
+        return lp_text(m) == f.read()
+
+
+def check_templates():
+    """Compare household models copied from templates with fresh ones."""
+    T = 48
+    for binaries in (True, False):
+        templates = {}
+        for hh in households(4, T, seed=3):
+            fresh = devices.household_model(hh, range(T), binaries=binaries)
+            copy = devices.household_model(
+                hh, range(T), binaries=binaries, templates=templates
+            )
+            if (
+                lp_text(fresh[0]) != lp_text(copy[0])
+                or fresh[1:] != copy[1:]
+            ):
+                return False
+        if len(templates) != 1:
+            # all households have the same structure: a single template
+            return False
+    return True
+
+
+def check_lp_sparse():
+    """Compare `assemble_lp_sparse` with `household_model`."""
+    T = 48
+    for binaries in (True, False):
+        for hh in households(2, T, seed=5):
+            a = devices.assemble_lp_sparse([hh], range(T), binaries=binaries)
+            b = devices.household_model(hh, range(T), binaries=binaries)[0]
+            if lp_text(a) != lp_text(b):
+                return False
+    return True
+
+
+def check_battery_fill():
+    """Compare generated battery fill functions with `_battery_coo`."""
+    rng = np.random.default_rng(0)
+    for T in (1, 2, 5, 24):
+        nnz = 3 + 4*(T-1) + 10*T
+        col_base, row_base = 7, 3
+        params = (
+            0.99, 0.5, rng.uniform(0.8, 1.), rng.uniform(0.8, 1.),
+            0., rng.uniform(1., 5.), 0., rng.uniform(1., 5.)
+        )
+        ref = [np.zeros(nnz, dtype=np.int64), np.zeros(nnz, dtype=np.int64),
+               np.zeros(nnz)]
+        n_ref = devices._battery_coo(
+            T,
+            col_base, col_base + T, col_base + 2*T, col_base + 3*T,
+            col_base + 4*T,
+            row_base,
+            *params,
+            *ref
+        )
+        gen = [np.zeros(nnz, dtype=np.int64), np.zeros(nnz, dtype=np.int64),
+               np.zeros(nnz)]
+        fill = devices.Battery.fill_function(T)
+        n_gen = fill(*gen, col_base, row_base, *params)
+        if n_ref != n_gen or not all(
+            np.array_equal(x, y) for x, y in zip(ref, gen)
+        ):
+            return False
+    return True
+
+
+def main():
+    checks = [
+        ('reference', check_reference),
+        ('templates', check_templates),
+        ('lp_sparse', check_lp_sparse),
+        ('battery_fill', check_battery_fill)
+    ]
+    failed = 0
+    for name, check in checks:
+        ok = check()
+        failed += not ok
+        print(f'{name:<14}', 'OK' if ok else 'FAILED')
+
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(main())